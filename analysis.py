@@ -0,0 +1,199 @@
+"""
+Imports
+"""
+
+# Data
+from compiler import Program, OPERATORS
+
+# Math
+from numpy import arange, asarray, unique
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Every value a neighbor count can take
+COUNTS = arange(9)
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+
+What a model's transition structure says about it before running it. An edge
+is dead if it can never fire: its probability is 0, or none of its conditions
+can ever hold, such as `nhood[s] > 8` or a condition on a state that doesn't
+exist. Only live edges that lead elsewhere make up the transitions.
+
+    absorbing       states without a transition out. Their cells are frozen
+                    for good, whatever surrounds them
+    components      strongly connected components, states that can all reach
+                    one another. Once left, a component is never returned to
+    closed          components without a transition out, where every cell
+                    ends up stuck for good
+    reachable       states some cell can ever be in, starting from the ones
+                    in the initial condition
+"""
+
+class Analysis:
+
+    def __init__(self, program: Program, initial=None):
+
+        self.program = program
+
+        # A state missing from the graph always has a count of 0
+        possible = [
+            OPERATORS[op](
+                COUNTS if program.planes[plane] >= 0 else 0, amount).any()
+            for plane, op, amount in program.comparisons
+        ]
+
+        satisfiable = [
+            any(possible[term] for term in terms)
+            for terms in program.disjunctions
+        ]
+
+        # The program's rules without their dead edges
+        self.rules = [
+            [
+                (disjunction, probability, target)
+                for disjunction, probability, target in rule
+                if probability > 0
+                and (disjunction is None or satisfiable[disjunction])
+            ]
+            for rule in program.rules
+        ]
+
+        self.dead = sum(map(len, program.rules)) - sum(map(len, self.rules))
+
+        self.targets = [
+            sorted({target for _, _, target in rule if target != state})
+            for state, rule in enumerate(self.rules)
+        ]
+
+        self.absorbing = [
+            state for state, targets in enumerate(self.targets) if not targets]
+
+        self.components = strongComponents(self.targets)
+
+        component = {s: i for i, c in enumerate(self.components) for s in c}
+
+        self.closed = [
+            c for i, c in enumerate(self.components)
+            if all(component[t] == i for s in c for t in self.targets[s])
+        ]
+
+        # Without an initial condition, any state may be in it
+        if initial is None: self.initial = list(range(program.states))
+        else: self.initial = unique(asarray(initial)).tolist()
+
+        self.reachable = reach(self.targets, self.initial)
+        self.unreachable = sorted(set(range(program.states)) - self.reachable)
+
+    # ------------------------------------
+
+    # Lookup table of whether cells in each state are ever evaluated again
+    def live(self):
+
+        live = [True] * self.program.states
+        for state in self.absorbing: live[state] = False
+
+        return live
+
+
+    def report(self) -> str:
+
+        names = self.program.names
+        listed = lambda states: ", ".join(names[s] for s in states) or "none"
+
+        transient = [c for c in self.components if c not in self.closed]
+
+        return "\n".join((
+            f"{self.program.states} states, {self.dead} dead edges",
+            f"Absorbing states: {listed(self.absorbing)}",
+            f"Closed components: " + ("; ".join(
+                listed(c) for c in self.closed) or "none"),
+            f"Transient components: {len(transient)}",
+            f"Unreachable states: {listed(self.unreachable)}",
+        ))
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# Tarjan's algorithm, iteratively so deep chains don't hit the recursion
+# limit. Components come out in reverse topological order
+def strongComponents(targets) -> list[list[int]]:
+
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+
+    for root in range(len(targets)):
+
+        if root in index: continue
+
+        work = [(root, 0)]
+
+        while work:
+
+            state, i = work.pop()
+
+            if i == 0:
+                index[state] = low[state] = len(index)
+                stack.append(state)
+                on_stack.add(state)
+
+            # Resumes the state from its i-th target
+            for j in range(i, len(targets[state])):
+
+                target = targets[state][j]
+
+                if target not in index:
+                    work.append((state, j + 1))
+                    work.append((target, 0))
+                    break
+
+                if target in on_stack:
+                    low[state] = min(low[state], index[target])
+
+            else:
+
+                if low[state] == index[state]:
+
+                    component = []
+
+                    while True:
+                        s = stack.pop()
+                        on_stack.discard(s)
+                        component.append(s)
+                        if s == state: break
+
+                    components.append(sorted(component))
+
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[state])
+
+    return components
+
+
+def reach(targets, start) -> set:
+
+    seen = set(start)
+    frontier = list(seen)
+
+    while frontier:
+
+        for target in targets[frontier.pop()]:
+
+            if target not in seen:
+                seen.add(target)
+                frontier.append(target)
+
+    return seen
+
+
+def analyze(program: Program, initial=None) -> Analysis:
+    return Analysis(program, initial)
@@ -0,0 +1,189 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph
+from codeGenerator import slugify
+
+# Math
+from numpy import load
+
+# Parallelism
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Misc
+from argparse import ArgumentParser
+from hashlib import sha256
+import shutil
+import os
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Bumped whenever the generated code changes, so older outputs are redone
+EXPORT_VERSION = 3
+
+# First line of every exported script, recording what it was made from
+HASH_HEADER = "# Exported by AC Designer, content hash "
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# Everything an export depends on: the model, its initial condition if any,
+# and the options. Equal hashes mean the output would come out the same. An
+# initial condition sets the grid's side, so `dimension` doesn't count then
+def contentHash(model: str, condition: str=None, dimension=30) -> str:
+
+    if condition is not None: dimension = None
+    h = sha256(f"{EXPORT_VERSION} {dimension}\n".encode())
+
+    for filename in (model, condition):
+
+        if filename is None: continue
+
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+
+# The hash recorded by a previous export, or None
+def exportedHash(output: str):
+
+    try:
+        with open(output) as f: line = f.readline()
+
+    except OSError: return None
+
+    if line.startswith(HASH_HEADER): return line[len(HASH_HEADER):].strip()
+    return None
+
+# ------------------------------------
+
+# Models under `source`, as (model, initial condition) pairs. A model's
+# initial condition is a .npy file next to it, with the same name
+def findModels(source: str):
+
+    for root, dirs, files in os.walk(source):
+
+        dirs.sort()
+
+        for filename in sorted(files):
+
+            if not filename.lower().endswith('.xml'): continue
+
+            model = os.path.join(root, filename)
+            condition = os.path.splitext(model)[0] + '.npy'
+
+            yield model, condition if os.path.exists(condition) else None
+
+
+# Runs in a worker process. Returns the script written
+def exportModel(model: str, condition: str, output: str, digest: str,
+                dimension=30) -> str:
+
+    name = slugify(os.path.splitext(os.path.basename(output))[0])
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+    condfile = None
+
+    # The script loads its initial condition from right next to itself, and
+    # the grid's side comes from it rather than from `dimension`. It's named
+    # after the script, as slugs of different names may clash
+    if condition is not None:
+        condfile = os.path.splitext(os.path.basename(output))[0] + '.npy'
+        shutil.copyfile(
+            condition, os.path.join(os.path.dirname(output), condfile))
+
+        dimension = load(condition, mmap_mode='r').shape[0]
+
+    graph = Graph.loadXML(model)
+
+    # Written aside and moved in place, so an interrupted export never
+    # leaves a script that claims to be up to date
+    with open(output + '.tmp', 'w') as f:
+        f.write(f"{HASH_HEADER}{digest}\n")
+        graph.writeCode(
+            f, name=name, condfile=condfile, dimension=dimension)
+
+    os.replace(output + '.tmp', output)
+    return output
+
+# ------------------------------------
+
+# Exports every model under `source` into the same structure under
+# `destination`. Returns the counts of exported, skipped and failed models
+def exportDirectory(source: str, destination: str, jobs=None, dimension=30,
+                    force=False, log=print):
+
+    exported = skipped = failed = 0
+    pending = []
+
+    for model, condition in findModels(source):
+
+        relative = os.path.relpath(os.path.splitext(model)[0], source)
+        output = os.path.join(destination, relative + '.py')
+
+        digest = contentHash(model, condition, dimension)
+
+        if not force and exportedHash(output) == digest:
+            skipped += 1
+            continue
+
+        pending.append((model, condition, output, digest))
+
+    if not pending: return exported, skipped, failed
+
+    with ProcessPoolExecutor(jobs) as pool:
+
+        futures = {
+            pool.submit(exportModel, *job, dimension=dimension): job[0]
+            for job in pending
+        }
+
+        for future in as_completed(futures):
+
+            try:
+                log(f"Exported {future.result()}")
+                exported += 1
+
+            except Exception as e:
+                log(f"Failed {futures[future]}: {e}")
+                failed += 1
+
+    return exported, skipped, failed
+
+# ------------------------------------------------------------------------------
+"""
+Main Code
+"""
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description="Exports every XML model under a directory to code")
+
+    parser.add_argument("source", help="Directory searched for models")
+    parser.add_argument("destination", help="Directory the scripts go to")
+
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Worker processes, all cores by default")
+    parser.add_argument("-d", "--dimension", type=int, default=30,
+                        help="Grid side for models without initial condition")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Export even models that haven't changed")
+
+    args = parser.parse_args()
+
+    exported, skipped, failed = exportDirectory(
+        args.source, args.destination, args.jobs, args.dimension, args.force)
+
+    print(f"{exported} exported, {skipped} unchanged, {failed} failed")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,288 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph, Node, Op
+import json
+
+# Math
+from numpy import (
+    array, asarray, dtype, empty, zeros, frombuffer, memmap, cumsum, uint8
+)
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+
+A model file is a header, a directory of sections and the sections themselves,
+each starting on an ALIGN byte boundary so they can be viewed straight out of
+a memory map. Everything is little-endian
+"""
+
+# PNG style: catches text mode transfers mangling line endings
+MAGIC = b'\x89ACM\r\n\x1a\n'
+VERSION = 1
+ALIGN = 64
+
+HEADER = dtype([('magic', 'S8'), ('version', '<u4'), ('sections', '<u4')])
+SECTION = dtype([('name', 'S8'), ('offset', '<u8'), ('size', '<u8')])
+
+# Names and colors are indexes into the string pool. Edges list how many
+# conditions they own, which follow each other in edge order
+NODES = dtype([
+    ('id', '<i8'), ('name', '<u4'), ('x', '<f8'), ('y', '<f8'),
+    ('color', '<u4'),
+])
+
+EDGES = dtype([
+    ('id', '<i8'), ('name', '<u4'), ('src', '<i8'), ('dst', '<i8'),
+    ('probability', '<i8'), ('offset', '<f8'), ('priority', '<i8'),
+    ('conditions', '<u4'),
+])
+
+CONDITIONS = dtype([('state', '<i8'), ('op', 'u1'), ('amnt', '<i8')])
+
+OPS = list(Op)
+
+# Sections every model file has, the grid only comes with an initial condition
+REQUIRED = ('nodes', 'edges', 'conds', 'strings', 'strends', 'meta')
+
+# ------------------------------------------------------------------------------
+"""
+Writing
+"""
+
+# Every distinct string once, UTF-8 encoded back to back
+class StringPool:
+
+    def __init__(self):
+        self.index = {}
+
+
+    def __call__(self, text: str) -> int:
+        return self.index.setdefault(text, len(self.index))
+
+
+    # The pool's bytes, and the offsets where each string starts and ends
+    def pack(self):
+
+        encoded = [text.encode() for text in self.index]
+        ends = cumsum([0] + [len(e) for e in encoded], dtype='<u8')
+
+        return b''.join(encoded), ends
+
+# ------------------------------------
+
+def saveBinary(graph: Graph, filename: str, initial=None, settings=None):
+
+    strings = StringPool()
+
+    nodes = empty(len(graph.nodes), dtype=NODES)
+
+    for row, node in zip(nodes, graph.nodes):
+        row['id'], row['name'], row['color'] = \
+            node.id, strings(node.name), strings(node.color)
+
+    if len(nodes):
+        nodes['x'], nodes['y'] = graph.store.pos[
+            graph.store.rows(graph.nodes)].T
+
+    edges = empty(len(graph.edges), dtype=EDGES)
+    conditions = []
+
+    for row, edge in zip(edges, graph.edges):
+
+        row['id'], row['name'] = edge.id, strings(edge.name)
+        row['src'], row['dst'] = edge.nodes[0].id, edge.nodes[1].id
+        row['probability'], row['offset'] = edge.probability, edge.offset
+        row['priority'] = edge.priority
+        row['conditions'] = len(edge.conditions)
+
+        conditions.extend(
+            (c.state, OPS.index(c.op), c.amnt) for c in edge.conditions)
+
+    pool, ends = strings.pack()
+
+    sections = {
+        'nodes': nodes.tobytes(),
+        'edges': edges.tobytes(),
+        'conds': array(conditions, dtype=CONDITIONS).tobytes(),
+        'strings': pool,
+        'strends': ends.tobytes(),
+    }
+
+    meta = {'settings': settings or {}}
+
+    if initial is not None:
+
+        initial = asarray(initial)
+        meta['grid'] = {'dtype': initial.dtype.str, 'shape': initial.shape}
+
+        sections['grid'] = initial.tobytes(order='C')
+
+    sections['meta'] = json.dumps(meta).encode()
+
+    writeSections(filename, sections)
+
+
+def writeSections(filename: str, sections: dict):
+
+    header = zeros(1, dtype=HEADER)
+    header['magic'], header['version'] = MAGIC, VERSION
+    header['sections'] = len(sections)
+
+    directory = zeros(len(sections), dtype=SECTION)
+    offset = aligned(HEADER.itemsize + directory.nbytes)
+
+    for entry, (name, data) in zip(directory, sections.items()):
+
+        entry['name'], entry['offset'], entry['size'] = \
+            name.encode(), offset, len(data)
+
+        offset = aligned(offset + len(data))
+
+    with open(filename, 'wb') as f:
+
+        f.write(header.tobytes())
+        f.write(directory.tobytes())
+
+        for entry, data in zip(directory, sections.values()):
+            f.seek(int(entry['offset']))
+            f.write(data)
+
+
+def aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+# ------------------------------------------------------------------------------
+"""
+Reading
+"""
+
+# The raw bytes of every section, as views into a copy-on-write mapping of
+# the file: nothing is read until it's used, and the grid can be painted on
+# without touching the file
+def readSections(filename: str) -> dict:
+
+    data = memmap(filename, dtype=uint8, mode='c')
+
+    if len(data) < HEADER.itemsize:
+        raise ValueError(f"{filename} is not a model file")
+
+    header = frombuffer(data[:HEADER.itemsize], dtype=HEADER)[0]
+
+    if header['magic'] != MAGIC:
+        raise ValueError(f"{filename} is not a model file")
+
+    if header['version'] > VERSION:
+        raise ValueError(
+            f"{filename} has version {header['version']}, "
+            f"newer than the supported {VERSION}")
+
+    end = HEADER.itemsize + SECTION.itemsize * int(header['sections'])
+    directory = frombuffer(data[HEADER.itemsize:end], dtype=SECTION)
+
+    return {
+        entry['name'].decode(): data[
+            int(entry['offset']):int(entry['offset']) + int(entry['size'])]
+        for entry in directory
+    }
+
+
+# The graph, its initial condition grid (or None) and its settings
+def loadBinary(filename: str):
+
+    sections = readSections(filename)
+
+    missing = [name for name in REQUIRED if name not in sections]
+
+    if missing:
+        raise ValueError(
+            f"{filename} is missing the {', '.join(missing)} section(s)")
+
+    pool = sections['strings'].tobytes()
+    ends = sections['strends'].view('<u8').tolist()
+
+    strings = [
+        pool[start:end].decode() for start, end in zip(ends[:-1], ends[1:])
+    ]
+
+    # Plain arrays over the mapping, slicing a memmap itself is slow
+    nodes = asarray(sections['nodes']).view(NODES)
+    edges = asarray(sections['edges']).view(EDGES)
+    conditions = asarray(sections['conds']).view(CONDITIONS)
+
+    # Every string index has to land in the pool
+    indexes = [nodes['name'], nodes['color'], edges['name']]
+
+    if any(len(i) and int(i.max()) >= len(strings) for i in indexes):
+        raise ValueError(f"{filename} refers to strings it doesn't have")
+
+    g = Graph()
+
+    for id, name, x, y, color in nodes.tolist():
+
+        n = Node(x, y, strings[name])
+        n.id = id
+        n.color = strings[color]
+
+        g.addNode(n, newid=False)
+
+    if len(nodes): g.next_id = int(nodes['id'].max()) + 1
+
+    # Each edge's conditions start where the previous edge's end
+    counts = edges['conditions'].astype(int)
+    starts = cumsum(counts) - counts
+    conditions = conditions.tolist()
+
+    for row, start in zip(edges.tolist(), starts.tolist()):
+
+        id, name, src, dst, probability, offset, priority, count = row
+
+        if g.getNode(src) is None or g.getNode(dst) is None:
+            raise ValueError(f"{filename} has edge {id} between missing nodes")
+
+        e = g.getNode(src).addEdge(g.getNode(dst))
+        e.id = id
+        g.addEdge(e, newid=False)
+
+        e.name = strings[name]
+        e.probability = probability
+        e.offset = offset
+        e.priority = priority
+
+        e.registered = True
+
+        for state, op, amnt in conditions[start:start + count]:
+            e.addCondition(state, OPS[op], amnt)
+
+    if len(edges): g.next_edge_id = int(edges['id'].max()) + 1
+
+    for node in g.nodes:
+        node.outgoing.sort(key=Node.edgeReorder)
+
+    meta = json.loads(bytes(sections['meta']).decode())
+    initial = None
+
+    if 'grid' in meta:
+
+        if 'grid' not in sections:
+            raise ValueError(f"{filename} is missing the grid section")
+
+        initial = sections['grid'].view(meta['grid']['dtype']).reshape(
+            meta['grid']['shape'])
+
+    return g, initial, meta['settings']
+
+# ------------------------------------------------------------------------------
+"""
+Conversion
+"""
+
+def xmlToBinary(source: str, destination: str):
+    saveBinary(Graph.loadXML(source), destination)
+
+
+def binaryToXML(source: str, destination: str):
+    loadBinary(source)[0].saveXML(destination)
@@ -1,5 +1,9 @@
 from string import Template
 
+# Sanitizing strings
+import unicodedata
+import re
+
 class CodeGen(dict):
     def __getattr__(self, name):
         if name in self.keys(): return self[name].substitute
@@ -34,16 +38,44 @@ Subtable = CodeGen({
 
     # ONCE
     "end": Template("\t\treturn s\n\n"),
-    "instantiate": Template("c = $name(30, values=range($statecount), max=$statecount -1)"),
+    "instantiate": Template("c = $name($dimension, values=range($statecount), max=$statecount -1)"),
     "plot": Template("plot(c, N=50, colors=$colors, names=$names, out='$name.pdf', graphic=True)"),
 
     # CONDITIONAL
     "initialCondition": Template("initial_condition = $list\n"),
+    "initialConditionFile": Template(
+        "from numpy import load\n"
+        "from os import path\n\n"
+        "initial_condition = load(\n"
+        "\tpath.join(path.dirname(path.abspath(__file__)), $file),\n"
+        "\tmmap_mode='r'\n"
+        ").ravel().tolist()\n"
+    ),
     "instantiateInitialCondition": Template(
-        "c = $name(30, random_values=False, values=initial_condition[::-1], max=$statecount -1)"
+        "c = $name($dimension, random_values=False, values=initial_condition[::-1], max=$statecount -1)"
     ),
     
     "inconditionalEdge": Template("\t\t\treturn $dst"),
     "prob": Template("random() < $percentage")
 
-})
\ No newline at end of file
+})
+
+
+def slugify(value, allow_unicode=False):
+    """
+    Taken from https://github.com/django/django/blob/master/django/utils/text.py
+    Convert to ASCII if 'allow_unicode' is False. Convert spaces or repeated
+    dashes to single dashes. Remove characters that aren't alphanumerics,
+    underscores, or hyphens. Convert to lowercase. Also strip leading and
+    trailing whitespace, dashes, and underscores.
+    """
+    value = str(value)
+    if allow_unicode:
+        value = unicodedata.normalize('NFKC', value)
+
+    else:
+        value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').\
+            decode('ascii')
+
+    value = re.sub(r'[^\w\s-]', '', value.lower())
+    return re.sub(r'[-\s]+', '-', value).strip('-_').replace('-', '_')
@@ -0,0 +1,152 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph, Op
+
+# Math
+from numpy import greater, greater_equal, equal, less, less_equal, not_equal
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+OPERATORS = {
+    Op.GT: greater,
+    Op.GE: greater_equal,
+    Op.EQ: equal,
+    Op.LT: less,
+    Op.LE: less_equal,
+    Op.NE: not_equal,
+}
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+
+A graph's rule, compiled for engine.py into three layers of shared work, each
+evaluated at most once per step over the whole grid:
+
+    planes          how many neighbors of each cell are in a given state
+    comparisons     a plane compared against an amount, `nhood[s] op amnt`
+    disjunctions    comparisons or'ed together, the condition of an edge
+
+Edges only refer to a disjunction. However many edges, in however many nodes,
+test the same thing, it's computed a single time.
+
+States are positions in graph.nodes, the same as the initial condition's and
+the plot's, rather than node ids
+"""
+
+class Program:
+
+    def __init__(self, graph: Graph):
+
+        self.names = [node.name for node in graph.nodes]
+        self.colors = [node.color for node in graph.nodes]
+
+        index = {node.id: i for i, node in enumerate(graph.nodes)}
+
+        self.planes = []        # States counted, -1 for ones not in the graph
+        self.comparisons = []   # (plane, op, amount)
+        self.disjunctions = []  # Sorted tuples of comparisons
+
+        planes, comparisons, disjunctions = {}, {}, {}
+
+        # Per state, its edges in the order they're tried, as
+        # (disjunction or None, probability, target state)
+        self.rules = []
+
+        # Naive costs, as the generated code would pay them per cell
+        self.conditions = self.ors = 0
+
+        for node in graph.nodes:
+
+            rule = []
+
+            for edge in node.outgoing:
+
+                terms = set()
+
+                for c in edge.conditions:
+
+                    state = index.get(c.state, -1)
+                    plane = planes.setdefault(state, len(planes))
+
+                    key = (plane, c.op, c.amnt)
+                    terms.add(comparisons.setdefault(key, len(comparisons)))
+
+                    self.conditions += 1
+
+                if terms:
+                    self.ors += len(edge.conditions) - 1
+
+                    terms = tuple(sorted(terms))
+                    disjunction = disjunctions.setdefault(
+                        terms, len(disjunctions))
+
+                else: disjunction = None
+
+                rule.append((
+                    disjunction, edge.probability, index[edge.nodes[1].id]))
+
+            self.rules.append(rule)
+
+        self.planes = list(planes)
+        self.comparisons = list(comparisons)
+        self.disjunctions = list(disjunctions)
+
+    # ------------------------------------
+
+    @property
+    def states(self) -> int:
+        return len(self.rules)
+
+
+    # Operations per cell and step, against evaluating every condition of
+    # every edge on its own: a count and a comparison each, plus the ors
+    def stats(self) -> dict:
+
+        edges = [rule for rules in self.rules for rule in rules]
+        ors = sum(len(d) - 1 for d in self.disjunctions)
+
+        naive = 2 * self.conditions + self.ors
+        compiled = len(self.planes) + len(self.comparisons) + ors
+
+        return {
+            'edges': len(edges),
+            'conditional edges': sum(d is not None for d, _, _ in edges),
+            'conditions': self.conditions,
+            'planes': len(self.planes),
+            'comparisons': len(self.comparisons),
+            'disjunctions': len(self.disjunctions),
+            'naive': naive,
+            'compiled': compiled,
+            'saved': naive - compiled,
+        }
+
+
+    def report(self) -> str:
+
+        s = self.stats()
+
+        return "\n".join((
+            f"{s['edges']} edges, {s['conditional edges']} with conditions, "
+            f"{s['conditions']} conditions in total",
+            f"Neighbor counts: {s['planes']} instead of {s['conditions']}",
+            f"Comparisons: {s['comparisons']} instead of {s['conditions']}",
+            f"Distinct edge conditions: {s['disjunctions']} instead of "
+            f"{s['conditional edges']}",
+            f"Operations per cell and step: {s['compiled']} instead of "
+            f"{s['naive']}, {s['saved']} saved",
+        ))
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+def compileGraph(graph: Graph) -> Program:
+    return Program(graph)
@@ -3,15 +3,18 @@ Imports
 """
 
 # Data
-from vector import vec
+from vector import vec, Vector
+from numpy import zeros, array, flatnonzero, int32
 from enum import Enum
 from typing import Union
 import abc
 import xml.dom.minidom as xml
+from xml.etree.ElementTree import iterparse
 from codeGenerator import Subtable
 
 # Misc
 from time import time
+from math import isqrt
 
 # ------------------------------------------------------------------------------
 """
@@ -20,6 +23,9 @@ Globals
 
 DOM = xml.getDOMImplementation()
 
+# Initial condition cells written to generated code at a time
+CODE_CHUNK = 1 << 14
+
 # ------------------------------------------------------------------------------
 """
 Invisible classes
@@ -28,6 +34,8 @@ Invisible classes
 # Classes that inherit from XMLable should be able to create XML elements
 class XMLable(abc.ABC):
 
+    __slots__ = ()
+
     @abc.abstractmethod
     def toXML(self, doc: xml.Document) -> xml.Element: pass
 
@@ -61,14 +69,17 @@ class Condition(XMLable):
 
     # ------------------------------------
 
-    def toXML(self, doc: xml.Document) -> xml.Element:
+    def attributes(self) -> dict:
 
-        el = doc.createElement("condition")
-        el.setAttribute("state", f"{self.state}")
-        el.setAttribute("op", self.op.value)
-        el.setAttribute("amnt", f"{self.amnt}")
+        return {
+            "state": f"{self.state}",
+            "op": self.op.value,
+            "amnt": f"{self.amnt}",
+        }
 
-        return el
+
+    def toXML(self, doc: xml.Document) -> xml.Element:
+        return xmlElement(doc, "condition", self.attributes())
 
     # ------------------------------------
 
@@ -78,64 +89,267 @@ class Condition(XMLable):
 
 # ------------------------------------------------------------------------------
 
+# Insertion-ordered collection with O(1) append, removal and membership, used
+# for a graph's items and a node's edges. Sorting re-orders it in place
+class OrderedSet:
+
+    __slots__ = ('items',)
+
+    def __init__(self, items=()):
+        self.items = dict.fromkeys(items)
+
+    # ------------------------------------
+
+    def append(self, item):
+        self.items[item] = None
+
+    def remove(self, item):
+        del self.items[item]
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+    def clear(self):
+        self.items.clear()
+
+    def sort(self, key=None, reverse=False):
+        self.items = dict.fromkeys(sorted(self.items, key=key, reverse=reverse))
+
+    # ------------------------------------
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        return reversed(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    # Positional access, kept for code written against lists. Linear time
+    def __getitem__(self, index):
+        return list(self.items)[index]
+
+    # Concatenation snapshots both sides, so the result may be iterated while
+    # either one is modified
+    def __add__(self, other):
+        return [*self.items, *other]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self.items)})"
+
+# ------------------------------------------------------------------------------
+
 # The base class for both Nodes and Edges.
 # This class implements some common QWidget stuff
 class Base:
 
+    __slots__ = ()
+
+    graph = None # Set while the object belongs to a Graph
+
     def __init__(self):
         self._highlit = False
 
     # ------------------------------------
 
+    # Lets the owning graph tell its listeners that this object changed
+    def notify(self, kind: str):
+        if self.graph is not None: self.graph.notify(kind, self)
+
+    # ------------------------------------
+
+    # Drawing flag, set by the canvas' Selection for the items it holds
     def getHighlight(self):
         return self._highlit
 
     def setHighlight(self, state: bool):
-
         self._highlit = state
-        cls = type(self)
 
-        if state:               cls.lit.append(self)
-        elif self in cls.lit:   cls.lit.remove(self)
+    highlit = property(getHighlight, setHighlight)
+
+# ------------------------------------------------------------------------------
+
+# Columnar storage for the drawing attributes of many nodes, one row each.
+# Removing a node moves the last row into its place, so rows stay contiguous
+class NodeStore:
+
+    columns = {
+        'pos': ((2,), float),
+        'radius': ((), float),
+        'color': ((), int32), # Index into palette
+        'lit': ((), bool),
+    }
+
+    def __init__(self, capacity=64):
+
+        self.nodes: list[Node] = []
+
+        # Colors are few and repeat a lot, so only their indexes are stored
+        self.palette: list[str] = []
+        self.colors = {}
+
+        for column, (shape, dtype) in self.columns.items():
+            setattr(self, column, zeros((capacity, *shape), dtype=dtype))
 
     # ------------------------------------
 
-    @classmethod
-    def unhighlight(cls):
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def colorIndex(self, color: str) -> int:
 
-        for i in cls.lit: i.highlit = False
-        cls.lit.clear()
+        if color not in self.colors:
+            self.colors[color] = len(self.palette)
+            self.palette.append(color)
+
+        return self.colors[color]
 
     # ------------------------------------
 
-    highlit = property(getHighlight, setHighlight)
+    def _grow(self):
+
+        for column in self.columns:
+
+            old = getattr(self, column)
+            new = zeros((len(old) * 2, *old.shape[1:]), dtype=old.dtype)
+            new[:len(old)] = old
+
+            setattr(self, column, new)
+
+
+    def append(self, node, pos, radius, color: str, lit: bool):
+
+        if len(self.nodes) == len(self.pos): self._grow()
+        row = len(self.nodes)
+
+        self.pos[row] = pos
+        self.radius[row] = radius
+        self.color[row] = self.colorIndex(color)
+        self.lit[row] = lit
+
+        self.nodes.append(node)
+        node.store, node.row = self, row
+
+
+    # Takes the node's row away from whichever store it currently lives in
+    def adopt(self, node):
+
+        old, row = node.store, node.row
+
+        pos, radius = old.pos[row].copy(), old.radius[row]
+        color, lit = old.palette[old.color[row]], old.lit[row]
+
+        old.discard(node)
+        self.append(node, pos, radius, color, lit)
+
+
+    def discard(self, node):
+
+        row = node.row
+        last = self.nodes.pop()
+
+        if last is not node:
+
+            for column in self.columns:
+                c = getattr(self, column)
+                c[row] = c[len(self.nodes)]
+
+            self.nodes[row] = last
+            last.row = row
+
+    # ------------------------------------
+    # Whole-graph operations
+
+    def rows(self, nodes):
+        return array([node.row for node in nodes], dtype=int)
+
+
+    def translate(self, nodes, delta):
+        self.pos[self.rows(nodes)] += delta
+
+
+    # Nodes whose hit box (the same one Canvas indexes) overlaps the
+    # x0, y0, x1, y1 box, in row order
+    def within(self, box):
+
+        n = len(self.nodes)
+        x0, y0, x1, y1 = box
+
+        pos, r = self.pos[:n], self.radius[:n]
+
+        inside = (pos[:, 0] - r <= x1) & (pos[:, 0] + r >= x0) &\
+                 (pos[:, 1] - r <= y1) & (pos[:, 1] + r >= y0)
+
+        return [self.nodes[i] for i in flatnonzero(inside)]
 
 # ------------------------------------------------------------------------------
 
+# Nodes hold no drawing attributes themselves, they are views into a row of
+# a NodeStore: their Graph's, or a private one while they belong to none
 class Node(Base, XMLable):
 
+    __slots__ = ('incoming', 'outgoing', 'name', 'id', 'graph', 'store', 'row')
+
     edgeReorder = lambda e: e.priority
 
-    lit = []
-    radius = 40
+    default_radius = 40
 
-    def __init__(self, x, y, name='', radius=-1, highlight=True):
+    def __init__(self, x, y, name='', radius=-1):
 
-        self.incoming: list[Edge] = []
-        self.outgoing: list[Edge] = []
+        # Kept in priority order
+        self.incoming = OrderedSet()
+        self.outgoing = OrderedSet()
 
         self.name = name
         self.id = -1 # Adjusted by Graph
+        self.graph = None
 
-        self.color = '#ffffff'
+        if radius < 0: radius = type(self).default_radius
+        NodeStore(capacity=1).append(self, (x, y), radius, '#ffffff', False)
+
+    # ------------------------------------
+
+    def getPos(self):
+        return self.store.pos[self.row].copy().view(Vector)
+
+    def setPos(self, pos):
+        self.store.pos[self.row] = pos
+        self.notify('move')
+
+    pos = property(getPos, setPos)
 
-        self.pos = vec(x, y)
 
-        if radius < 0: radius = type(self).radius
-        self.radius = radius
+    def getRadius(self):
+        return self.store.radius[self.row]
 
-        type(self).unhighlight()
-        self.setHighlight(highlight)
+    def setRadius(self, radius):
+        self.store.radius[self.row] = radius
+
+    radius = property(getRadius, setRadius)
+
+
+    def getColor(self):
+        return self.store.palette[self.store.color[self.row]]
+
+    def setColor(self, color: str):
+        self.store.color[self.row] = self.store.colorIndex(color)
+
+    color = property(getColor, setColor)
+
+
+    # Base's highlight flag, kept in the store as well
+    def _getLit(self):
+        return bool(self.store.lit[self.row])
+
+    def _setLit(self, state: bool):
+        self.store.lit[self.row] = state
+
+    _highlit = property(_getLit, _setLit)
 
     # ------------------------------------
 
@@ -151,16 +365,21 @@ class Node(Base, XMLable):
 
     # ------------------------------------
 
-    def toXML(self, doc: xml.Document) -> xml.Element:
+    def attributes(self) -> dict:
 
-        el = doc.createElement("node")
-        el.setAttribute("id", f"{self.id}")
-        el.setAttribute("name", f"{self.name}")
-        el.setAttribute("x", f"{self.pos.x}")
-        el.setAttribute("y", f"{self.pos.y}")
-        el.setAttribute("color", f"{self.color}")
+        x, y = self.store.pos[self.row].tolist()
+
+        return {
+            "id": f"{self.id}",
+            "name": f"{self.name}",
+            "x": f"{x}",
+            "y": f"{y}",
+            "color": f"{self.color}",
+        }
 
-        return el
+
+    def toXML(self, doc: xml.Document) -> xml.Element:
+        return xmlElement(doc, "node", self.attributes())
 
     # ------------------------------------
 
@@ -174,16 +393,16 @@ class Node(Base, XMLable):
 
 class Edge(Base, XMLable):
 
-    lit = []
     arrow_width = 5
     arrow_height = 8
     size_multiplier = 1.5
     box_angle = 15
 
-    def __init__(self, node0: Node, node1: Node, highlit=True, register=True):
+    def __init__(self, node0: Node, node1: Node, register=True):
 
         self.nodes = node0, node1
         self.priority = len(node0.outgoing)
+        self.id = -1 # Adjusted by Graph
 
         if register: self.register()
 
@@ -191,11 +410,21 @@ class Edge(Base, XMLable):
         self.conditions: list[Condition] = []
         self.probability = 100
 
-        self.offset = 30 # Drawing-related
+        self._offset = 30 # Drawing-related
         self.registered = False
 
-        type(self).unhighlight()
-        self.setHighlight(highlit)
+        self._highlit = False
+
+    # ------------------------------------
+
+    def getOffset(self):
+        return self._offset
+
+    def setOffset(self, offset):
+        self._offset = offset
+        self.notify('move')
+
+    offset = property(getOffset, setOffset)
 
     # ------------------------------------
 
@@ -223,15 +452,22 @@ class Edge(Base, XMLable):
 
     # ------------------------------------
 
+    def attributes(self) -> dict:
+
+        return {
+            "id": f"{self.id}",
+            "name": f"{self.name}",
+            "src": f"{self.nodes[0].id}",
+            "dst": f"{self.nodes[1].id}",
+            "probability": f"{self.probability}",
+            "offset": f"{self.offset}",
+            "priority": f"{self.priority}",
+        }
+
+
     def toXML(self, doc: xml.Document) -> xml.Element:
 
-        el = doc.createElement("edge")
-        el.setAttribute("name", f"{self.name}")
-        el.setAttribute("src", f"{self.nodes[0].id}")
-        el.setAttribute("dst", f"{self.nodes[1].id}")
-        el.setAttribute("probability", f"{self.probability}")
-        el.setAttribute("offset", f"{self.offset}")
-        el.setAttribute("priority", f"{self.priority}")
+        el = xmlElement(doc, "edge", self.attributes())
 
         conds = doc.createElement("conditions")
         for condition in self.conditions:
@@ -270,11 +506,36 @@ class Edge(Base, XMLable):
 class Graph:
 
     def __init__(self):
-        self.nodes: list[Node] = []
-        self.edges: list[Edge] = []
+        self.nodes = OrderedSet()
+        self.edges = OrderedSet()
         self.next_id = 0
+        self.next_edge_id = 0
         self.creation_time = time()
 
+        # id -> item
+        self.node_ids: dict[int, Node] = {}
+        self.edge_ids: dict[int, Edge] = {}
+
+        # Positions, radii, colors and highlights of every node
+        self.store = NodeStore()
+
+        # Callables taking (kind, obj), where kind is one of 'add', 'remove',
+        # 'move', 'moves' and 'edit'. Used to keep derived structures (e.g.
+        # indexes) in sync. 'moves' comes once for many nodes moved together,
+        # with (nodes, delta) as obj
+        self.listeners = []
+
+    # ------------------------------------
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, kind: str, obj):
+        for listener in self.listeners: listener(kind, obj)
+
     # ------------------------------------
 
     def addNode(self, node: Node=None, x=-1, y=-1, newid=True):
@@ -287,6 +548,13 @@ class Graph:
             self.next_id += 1
 
         self.nodes.append(node)
+        self.node_ids[node.id] = node
+        self.store.adopt(node)
+
+        node.graph = self
+        self.notify('add', node)
+
+        return node
 
 
     def removeNode(self, node: Node):
@@ -295,26 +563,70 @@ class Graph:
             self.removeEdge(edge)
 
         self.nodes.remove(node)
+        self.node_ids.pop(node.id, None)
+
+        self.notify('remove', node)
+        node.graph = None
+
+        NodeStore(capacity=1).adopt(node)
 
     # ------------------------------------
 
-    def addEdge(self, node0, node1: Node=None):
+    def addEdge(self, node0, node1: Node=None, newid=True):
 
         if type(node0) is Node and type(node1) is Node:
-            self.edges.append(node0.addEdge(node1))
+            edge = node0.addEdge(node1)
 
         elif type(node0) is Edge:
-            self.edges.append(node0)
+            edge = node0
 
         else: raise TypeError()
 
-        return self.edges[-1]
+        if newid:
+            edge.id = self.next_edge_id
+            self.next_edge_id += 1
+
+        self.edges.append(edge)
+        self.edge_ids[edge.id] = edge
+
+        edge.graph = self
+        self.notify('add', edge)
+
+        return edge
 
 
     def removeEdge(self, edge: Edge):
 
         edge.unregister()
         self.edges.remove(edge)
+        self.edge_ids.pop(edge.id, None)
+
+        self.notify('remove', edge)
+        edge.graph = None
+
+    # ------------------------------------
+
+    def getNode(self, id: int) -> Node:
+        return self.node_ids.get(id)
+
+    def getEdge(self, id: int) -> Edge:
+        return self.edge_ids.get(id)
+
+    # ------------------------------------
+
+    # Moves all nodes by the same delta with a single array operation, and
+    # tells listeners once, as 'moves' with (nodes, delta)
+    def moveNodes(self, nodes, delta):
+
+        self.store.translate(nodes, delta)
+        self.notify('moves', (nodes, delta))
+
+
+    # Same, with one position per node. The delta is None
+    def placeNodes(self, nodes, positions):
+
+        self.store.pos[self.store.rows(nodes)] = positions
+        self.notify('moves', (nodes, None))
 
     # ------------------------------------
 
@@ -326,127 +638,191 @@ class Graph:
 
     # ------------------------------------
 
-    def saveXML(self, filename="test.xml"):
+    # The model's XML, a line at a time, exactly as minidom would indent it.
+    # Nothing but the current element is ever held in memory
+    def iterXML(self):
+
+        yield '<?xml version="1.0" ?>\n<AC>\n'
 
-        doc = DOM.createDocument(None, "AC", None)
-        nodes = doc.createElement("nodes")
+        if not self.nodes: yield '\t<nodes/>\n'
+
+        else:
+
+            yield '\t<nodes>\n'
+            for node in self.nodes:
+                yield xmlLine(2, "node", node.attributes())
+            yield '\t</nodes>\n'
+
+        if not self.edges: yield '\t<edges/>\n'
+
+        else:
 
-        for node in self.nodes:
-            nodes.appendChild(node.toXML(doc))
+            yield '\t<edges>\n'
+            for edge in self.edges:
 
-        doc.documentElement.appendChild(nodes)
+                yield xmlLine(2, "edge", edge.attributes(), True)
 
-        edges = doc.createElement("edges")
-        for edge in self.edges:
-            edges.appendChild(edge.toXML(doc))
+                if edge.conditions:
 
-        doc.documentElement.appendChild(edges)
+                    yield '\t\t\t<conditions>\n'
+                    for condition in edge.conditions:
+                        yield xmlLine(4, "condition", condition.attributes())
+                    yield '\t\t\t</conditions>\n'
+
+                else: yield '\t\t\t<conditions/>\n'
+
+                yield '\t\t</edge>\n'
+
+            yield '\t</edges>\n'
+
+        yield '</AC>\n'
+
+
+    def saveXML(self, filename="test.xml"):
 
         with open(filename, "w") as f:
-            doc.writexml(f, addindent='\t', newl='\n')
+            f.writelines(self.iterXML())
 
     # ------------------------------------
 
+    # Parsed incrementally: each node or edge is built as soon as its element
+    # closes, then dropped from the tree. Edge ends are looked up by id
     @classmethod
     def loadXML(cls, filename="test.xml"):
 
         g = cls()
-        doc = xml.parse(filename)
+        parents = []
 
-        for node in doc.documentElement.getElementsByTagName("node"):
+        for event, el in iterparse(filename, events=("start", "end")):
 
-            attr = node.attributes
-            n = Node(
-                float(attr['x'].value),
-                float(attr['y'].value),
-                attr['name'].value
-            )
+            if event == "start":
+                parents.append(el)
+                continue
 
-            n.id = int(attr['id'].value)
-            n.color = attr['color'].value
-            g.next_id = max(n.id + 1, g.next_id)
+            parents.pop()
 
-            g.addNode(n, newid=False)
+            if el.tag == "node":
 
+                attr = el.attrib
+                n = Node(float(attr['x']), float(attr['y']), attr['name'])
 
-        for edge in doc.documentElement.getElementsByTagName("edge"):
+                n.id = int(attr['id'])
+                n.color = attr['color']
+                g.next_id = max(n.id + 1, g.next_id)
 
-            attr = edge.attributes
-            nodes = (
-                find(g.nodes, lambda i: i.id == int(attr['src'].value)),
-                find(g.nodes, lambda i: i.id == int(attr['dst'].value))
-            )
+                g.addNode(n, newid=False)
+
+            elif el.tag == "edge":
+
+                attr = el.attrib
+                nodes = g.getNode(int(attr['src'])), g.getNode(int(attr['dst']))
+
+                # Files from before edges had ids get fresh ones
+                if 'id' in attr:
 
-            e = g.addEdge(*nodes)
-            e.name = attr['name'].value
-            e.probability = int(attr['probability'].value)
-            e.offset = float(attr['offset'].value)
-            e.priority = int(attr['priority'].value)
+                    e = nodes[0].addEdge(nodes[1])
+                    e.id = int(attr['id'])
+                    g.next_edge_id = max(e.id + 1, g.next_edge_id)
 
-            e.registered = True
+                    g.addEdge(e, newid=False)
 
-            for condition in edge.getElementsByTagName("condition"):
+                else: e = g.addEdge(*nodes)
 
-                attr = condition.attributes
-                e.addCondition(
-                    int(attr['state'].value),
-                    Op(attr['op'].value),
-                    int(attr['amnt'].value)
-                )
+                e.name = attr['name']
+                e.probability = int(attr['probability'])
+                e.offset = float(attr['offset'])
+                e.priority = int(attr['priority'])
+
+                e.registered = True
+
+                for condition in el.iter("condition"):
+
+                    attr = condition.attrib
+                    e.addCondition(
+                        int(attr['state']), Op(attr['op']), int(attr['amnt']))
+
+            else: continue
+
+            if parents: parents[-1].remove(el)
 
         g.edges.sort(key=Node.edgeReorder)
         for node in g.nodes:
             node.outgoing.sort(key=Node.edgeReorder)
 
-        Node.unhighlight()
-        Edge.unhighlight()
         return g
 
     # ------------------------------------
 
+    # Code is produced as a stream of fragments, none bigger than a single
+    # node's rule or CODE_CHUNK cells of the initial condition, so it can go
+    # straight into a file however big the model or its grid
+
+    def iterCodeClass(self, name):
+
+        yield Subtable.namesetup(name=name)
+        yield "\n"
+
+        for i, node in enumerate(self.nodes):
+            if i: yield "\n"
+            yield node.toCode()
+
+        yield "\n"
+        yield Subtable.end()
+
+
     def _codeClass(self, name) -> str:
+        return "".join(self.iterCodeClass(name))
 
-        return "\n".join((
 
-            Subtable.namesetup(name=name),
-            "\n".join(node.toCode() for node in self.nodes),
-            Subtable.end()
+    # The initial condition either comes inline as a sequence of states
+    # (`cond`, e.g. a list or a flat array) or is loaded by the script from a
+    # .npy side file (`condfile`)
+    def iterCode(self, name="Test", cond=None, dimension=30, condfile=None):
 
-        ))
+        yield Subtable.imports()
+        yield "\n"
 
-    def generateCode(self, name="Test", cond=None) -> str:
+        yield from self.iterCodeClass(name)
+        yield "\n"
 
-        if cond:
+        if condfile:
 
-            return "\n".join((
-                Subtable.imports(),
+            yield Subtable.initialConditionFile(file=repr(condfile))
+            yield "\n"
+            yield Subtable.instantiateInitialCondition(
+                name=name, statecount=len(self.nodes), dimension=dimension)
 
-                self._codeClass(name),
+        elif cond is not None and len(cond):
 
-                Subtable.initialCondition(list=str(cond)),
-                Subtable.instantiateInitialCondition(
-                    name=name, statecount=len(self.nodes)),
-                Subtable.plot(
-                    name=name,
-                    colors=str([node.color for node in self.nodes]),
-                    names=str([node.name for node in self.nodes])
-                )
-            ))
+            yield from initialCondition(cond)
+            yield "\n"
+            yield Subtable.instantiateInitialCondition(
+                name=name, statecount=len(self.nodes),
+                dimension=isqrt(len(cond)))
 
         else:
 
-            return "\n".join((
-                Subtable.imports(),
+            yield Subtable.instantiate(
+                name=name, statecount=len(self.nodes), dimension=dimension)
+
+        yield "\n"
+        yield Subtable.plot(
+            name=name,
+            colors=str([node.color for node in self.nodes]),
+            names=str([node.name for node in self.nodes])
+        )
+
+
+    def writeCode(self, file, name="Test", cond=None, dimension=30,
+                  condfile=None):
 
-                self._codeClass(name),
+        file.writelines(self.iterCode(name, cond, dimension, condfile))
 
-                Subtable.instantiate(name=name, statecount=len(self.nodes)),
-                Subtable.plot(
-                    name=name,
-                    colors=str([node.color for node in self.nodes]),
-                    names=str([node.name for node in self.nodes])
-                )
-            ))
+
+    def generateCode(self, name="Test", cond=None, dimension=30,
+                     condfile=None) -> str:
+
+        return "".join(self.iterCode(name, cond, dimension, condfile))
 
 
 # ------------------------------------------------------------------------------
@@ -454,6 +830,52 @@ class Graph:
 Auxiliary functions
 """
 
+# A minidom element with the given attributes, in order
+def xmlElement(doc: xml.Document, tag: str, attributes: dict) -> xml.Element:
+
+    el = doc.createElement(tag)
+    for name, value in attributes.items(): el.setAttribute(name, value)
+
+    return el
+
+
+# The element's opening line, as minidom writes it at the given depth. Only
+# elements with children are left open
+def xmlLine(depth: int, tag: str, attributes: dict, open=False) -> str:
+
+    indent = "\t" * depth
+    attrs = "".join(
+        f' {name}="{xmlEscape(value)}"' for name, value in attributes.items())
+
+    return f"{indent}<{tag}{attrs}{'>' if open else '/>'}\n"
+
+
+def xmlEscape(text: str) -> str:
+
+    return text.replace("&", "&amp;").replace("<", "&lt;")\
+               .replace('"', "&quot;").replace(">", "&gt;")
+
+# ------------------------------------
+
+# Subtable.initialCondition around the states' list, written CODE_CHUNK states
+# at a time, the same as str(list(cond)) would
+def initialCondition(cond):
+
+    head, tail = Subtable.initialCondition(list="\0").split("\0")
+
+    yield head + "["
+
+    for i in range(0, len(cond), CODE_CHUNK):
+
+        chunk = cond[i:i + CODE_CHUNK]
+        if hasattr(chunk, "tolist"): chunk = chunk.tolist()
+
+        yield (", " if i else "") + ", ".join(map(str, chunk))
+
+    yield "]" + tail
+
+# ------------------------------------
+
 def find(iter, cond):
 
     for i in iter:
@@ -0,0 +1,289 @@
+"""
+Imports
+"""
+
+# Data
+from compiler import Program, OPERATORS
+from analysis import Analysis
+from grid import stateType
+
+# Math
+from numpy import (
+    asarray, zeros, pad, uint8, bincount, flatnonzero, empty, broadcast_to,
+    arange, quantile, concatenate, array, unravel_index, ravel_multi_index
+)
+from numpy.random import default_rng, SeedSequence
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# The eight cells around the center of a 3x3 window
+NEIGHBORS = [(dy, dx) for dy in range(3) for dx in range(3) if (dy, dx) != (1, 1)]
+
+# Below this share of live cells, a step only looks at those cells rather than
+# the whole grid
+SPARSE_FRACTION = 0.5
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# How many of each cell's eight neighbors are in `state`, over the last two
+# axes. Cells past the border count as no state at all, unless `wrap`
+def neighborCounts(grid, state: int, wrap=False):
+
+    counts = zeros(grid.shape, dtype=uint8)
+    if state < 0: return counts
+
+    h, w = grid.shape[-2:]
+    padding = [(0, 0)] * (grid.ndim - 2) + [(1, 1), (1, 1)]
+
+    match = pad(grid == state, padding, mode='wrap' if wrap else 'constant')
+
+    for dy, dx in NEIGHBORS:
+        counts += match[..., dy:dy + h, dx:dx + w]
+
+    return counts
+
+
+# The states of the eight neighbors of each of `cells`, flat positions in
+# `grid`, shaped (8, cells). Cells past the border are in state `outside`
+def neighborStates(grid, cells, outside: int, wrap=False):
+
+    *leading, h, w = grid.shape
+    padding = [(0, 0)] * len(leading) + [(1, 1), (1, 1)]
+
+    if wrap: padded = pad(grid, padding, mode='wrap')
+    else: padded = pad(grid, padding, constant_values=outside)
+
+    *index, y, x = unravel_index(cells, grid.shape)
+    centers = ravel_multi_index((*index, y + 1, x + 1), padded.shape)
+
+    offsets = array([(dy - 1) * (w + 2) + dx - 1 for dy, dx in NEIGHBORS])
+
+    return padded.ravel()[centers + offsets.reshape(-1, 1)]
+
+
+# An ensemble's run, shaped (steps + 1, replicates, states), summed up across
+# replicates: the mean and each of `quantiles`, shaped (steps + 1, states)
+def summarize(series, quantiles=(0.05, 0.5, 0.95)):
+
+    return {
+        'mean': series.mean(axis=1),
+        **{q: quantile(series, q, axis=1) for q in quantiles}
+    }
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Runs a compiled Program over a grid of states with NumPy, a whole step at
+# a time. Each cell tries its state's edges in order and takes the first one
+# whose condition holds and whose probability is drawn, exactly as the
+# generated code's rule does
+class Engine:
+
+    def __init__(self, program: Program, initial, seed=None, wrap=False):
+
+        self.program = program
+        self.wrap = wrap
+
+        # One state to spare, for the cells past the border
+        self.grid = asarray(initial).astype(stateType(program.states + 1))
+        self.rng = default_rng(seed)
+
+        # Dead edges are left out. Cells in absorbing states never change
+        # again, so they're skipped altogether
+        self.analysis = Analysis(program)
+        self.rules = self.analysis.rules
+        self.live = array(self.analysis.live() + [False])
+
+        self.steps = 0
+
+    # ------------------------------------
+
+    # Flat positions of the cells still worth evaluating, or None if there
+    # are enough of them that the whole grid is cheaper
+    def liveCells(self, grid):
+
+        if self.live.all(): return None
+
+        cells = flatnonzero(self.live[grid])
+        if len(cells) > SPARSE_FRACTION * grid.size: return None
+
+        return cells
+
+
+    # Neighbor counts of `cells`, or of the whole grid, as one flat array per
+    # plane
+    def planes(self, grid, cells):
+
+        p = self.program
+
+        if cells is None:
+            return [
+                neighborCounts(grid, state, self.wrap).ravel()
+                for state in p.planes
+            ]
+
+        neighbors = neighborStates(grid, cells, p.states, self.wrap)
+
+        return [
+            (neighbors == state).sum(axis=0, dtype=uint8) if state >= 0
+            else zeros(len(cells), dtype=uint8)
+            for state in p.planes
+        ]
+
+
+    # The condition of every edge, as one boolean array per disjunction.
+    # Planes and comparisons shared between edges are evaluated only once
+    def masks(self, grid, cells=None):
+
+        p = self.program
+        planes = self.planes(grid, cells)
+
+        comparisons = [
+            OPERATORS[op](planes[plane], amount)
+            for plane, op, amount in p.comparisons
+        ]
+
+        masks = []
+
+        for terms in p.disjunctions:
+
+            mask = comparisons[terms[0]].copy()
+            for term in terms[1:]: mask |= comparisons[term]
+
+            masks.append(mask)
+
+        return masks
+
+
+    def step(self):
+
+        grid = self.grid
+        cells = self.liveCells(grid)
+
+        states = grid.ravel() if cells is None else grid.ravel()[cells]
+        new = states.copy()
+
+        if len(states): masks = self.masks(grid, cells)
+
+        for state, rule in enumerate(self.rules):
+
+            if not rule or not self.live[state]: continue
+
+            pending = states == state
+            if not pending.any(): continue
+
+            for disjunction, probability, target in rule:
+
+                fire = pending.copy() if disjunction is None\
+                    else pending & masks[disjunction]
+
+                if probability < 100: self.draw(fire, probability, cells)
+
+                new[fire] = target
+                pending &= ~fire
+
+                if not pending.any(): break
+
+        if cells is None: self.grid = new.reshape(grid.shape)
+
+        else:
+            self.grid = grid.copy()
+            self.grid.ravel()[cells] = new
+
+        self.steps += 1
+
+
+    # Only cells whose condition holds draw a number, and those that miss it
+    # don't fire. `fire` covers `cells`, or the whole grid if None
+    def draw(self, fire, probability: int, cells=None):
+
+        where = flatnonzero(fire)
+        missed = self.rng.random(len(where)) >= probability / 100
+        fire[where[missed]] = False
+
+    # ------------------------------------
+
+    def population(self):
+        return bincount(self.grid.ravel(), minlength=self.program.states)
+
+
+    # How many cells are in each state, before the first step and after each
+    # of them, shaped (steps + 1, states)
+    def run(self, steps: int):
+
+        first = self.population()
+
+        series = empty((steps + 1, *first.shape), dtype=int)
+        series[0] = first
+
+        for i in range(steps):
+            self.step()
+            series[i + 1] = self.population()
+
+        return series
+
+# ------------------------------------
+
+# Many replicates of the same model, run at once as a (replicates, H, W) grid.
+# Every array operation covers them all, so only the random draws loop over
+# replicates, one independent stream each. A replicate's stream depends only
+# on the seed and its position, not on how many replicates run along
+class Ensemble(Engine):
+
+    def __init__(self, program: Program, initial, replicates: int, seed=None,
+                 wrap=False):
+
+        initial = asarray(initial)
+
+        # A single grid starts every replicate
+        if initial.ndim == 2:
+            initial = broadcast_to(initial, (replicates, *initial.shape))
+
+        elif len(initial) != replicates:
+            raise ValueError(
+                f"Expected {replicates} initial grids, got {len(initial)}")
+
+        super(type(self), self).__init__(program, initial, seed, wrap)
+
+        self.replicates = replicates
+        self.area = initial.shape[1] * initial.shape[2]
+        self.rngs = [
+            default_rng(s) for s in SeedSequence(seed).spawn(replicates)]
+
+    # ------------------------------------
+
+    # Each replicate draws from its own stream, and all the draws land at
+    # once, in the order the cells come up across the whole batch
+    def draw(self, fire, probability: int, cells=None):
+
+        where = flatnonzero(fire)
+        positions = where if cells is None else cells[where]
+
+        counts = bincount(
+            positions // self.area, minlength=self.replicates)
+
+        draws = concatenate(
+            [rng.random(n) for rng, n in zip(self.rngs, counts)])
+
+        fire[where[draws >= probability / 100]] = False
+
+
+    # Shaped (replicates, states). Each replicate's states are offset so a
+    # single bincount covers them all
+    def population(self):
+
+        states = self.program.states
+        offsets = arange(self.replicates).reshape(-1, 1, 1) * states
+
+        return bincount(
+            (self.grid + offsets).ravel(), minlength=self.replicates * states
+        ).reshape(self.replicates, states)
+
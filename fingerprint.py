@@ -0,0 +1,323 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph, Node, Edge
+from weakref import WeakKeyDictionary, ref
+
+# Misc
+from hashlib import sha256, blake2b
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Bumped whenever what goes into a fingerprint changes
+FINGERPRINT_VERSION = 3
+
+# Node hashes are combined by adding them up, modulo this
+MODULUS = 1 << 128
+
+# ------------------------------------------------------------------------------
+"""
+Canonical form
+
+Node ids and the order nodes were added in don't change what a model does, so
+neither may show in its fingerprint. Nodes are told apart by color refinement
+(Weisfeiler-Lehman) instead: every node starts out with a hash of its own
+data, then each round takes a new one from its old one and those of its
+neighbors: targets in the order edges are tried, the states their conditions
+count, and sources. Rounds go on until one no longer splits any class of
+nodes sharing a hash, after which none ever would. The fingerprint is the
+sum of the final hashes, which doesn't depend on the order nodes come in.
+
+Isomorphic graphs always share a fingerprint. An edit only changes the hashes
+of the nodes it reaches by each round, and the rounds' classes are counted as
+hashes change, so only those are computed again. Telling apart every pair of
+non-isomorphic graphs would take a full canonical labeling, which refinement
+approximates very closely
+"""
+
+# What a node is before looking at its neighbors. Only what the generated code
+# depends on, unless presentation data is asked for as well
+def nodeLabel(node: Node, presentation: bool):
+
+    label = (len(node.outgoing), len(node.incoming))
+
+    if presentation:
+        label += (node.name, node.color, *node.pos.tolist())
+
+    return label
+
+
+def edgeLabel(edge: Edge, presentation: bool):
+
+    label = (edge.probability,)
+    if presentation: label += (edge.name, float(edge.offset))
+
+    return label
+
+
+def digest(value) -> int:
+    return int.from_bytes(
+        blake2b(repr(value).encode(), digest_size=16).digest(), 'big')
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Every node's hash at every round, and per round how many nodes share each
+# hash and their sum. Hashes are only computed again for the nodes passed to
+# update and those their changes reach
+class Refinement:
+
+    def __init__(self, graph: Graph, presentation=False):
+
+        self.graph = graph
+        self.presentation = presentation
+
+        self.hashes = {} # Node id -> hash per round
+        self.classes = [] # Per round, hash -> how many nodes have it
+        self.sums = []
+
+        # Who counts each state in their conditions, as state -> edge id ->
+        # source node id, and the states each edge counts
+        self.referrers = {}
+        self.counted = {}
+
+    # ------------------------------------
+
+    def index(self, edge: Edge, removed=False):
+
+        for state in self.counted.pop(edge.id, ()):
+
+            edges = self.referrers[state]
+            edges.pop(edge.id, None)
+            if not edges: del self.referrers[state]
+
+        if removed: return
+
+        self.counted[edge.id] = {c.state for c in edge.conditions}
+
+        for state in self.counted[edge.id]:
+            self.referrers.setdefault(state, {})[edge.id] = edge.nodes[0].id
+
+
+    # Nodes whose hash depends on the hash of node `id`
+    def dependents(self, id: int):
+
+        node = self.graph.getNode(id)
+        if node is None: return set()
+
+        return (
+            {edge.nodes[1].id for edge in node.outgoing}
+            | {edge.nodes[0].id for edge in node.incoming}
+            | set(self.referrers.get(id, {}).values())
+        )
+
+
+    def nodeHash(self, node: Node, round: int) -> int:
+
+        if round == 0: return digest((0, nodeLabel(node, self.presentation)))
+
+        previous = lambda id: self.hashes[id][round - 1]
+
+        # A condition on a state that doesn't exist counts as -1
+        look = lambda id: previous(id) if id in self.hashes else -1
+
+        return digest((
+            round,
+            previous(node.id),
+            tuple(
+                (
+                    edgeLabel(edge, self.presentation),
+                    previous(edge.nodes[1].id),
+                    tuple(sorted(
+                        (look(c.state), c.op.value, c.amnt)
+                        for c in edge.conditions))
+                )
+                for edge in node.outgoing
+            ),
+            tuple(sorted(previous(edge.nodes[0].id) for edge in node.incoming))
+        ))
+
+    # ------------------------------------
+
+    # Brings the hashes up to date after the nodes `ids` changed, were added
+    # or removed
+    def update(self, ids):
+
+        dirty = set()
+
+        for id in ids:
+
+            if (node := self.graph.getNode(id)) is not None:
+
+                # Conditions are read now, edges may have been added before
+                # they were filled in
+                for edge in node.outgoing: self.index(edge)
+                dirty.add(id)
+
+            elif id in self.hashes:
+                for round, h in enumerate(self.hashes.pop(id)):
+                    self.count(round, h, -1)
+
+        # Nodes that changed are hashed again every round, their dependents
+        # only once something they depend on came out different
+        changed = set()
+        round = 0
+
+        while True:
+
+            # A round past the last one kept is new to every node
+            if round == len(self.classes):
+                self.classes.append({})
+                self.sums.append(0)
+                todo = {node.id for node in self.graph.nodes}
+
+            else:
+                todo = dirty.union(
+                    changed, *(self.dependents(id) for id in changed))
+
+            changed = set()
+
+            for id in todo:
+
+                h = self.nodeHash(self.graph.getNode(id), round)
+                hashes = self.hashes.setdefault(id, [])
+
+                if round < len(hashes):
+                    if hashes[round] == h: continue
+                    self.count(round, hashes[round], -1)
+                    hashes[round] = h
+
+                else: hashes.append(h)
+
+                self.count(round, h, 1)
+                changed.add(id)
+
+            # Rounds only ever split classes, so one that doesn't split any
+            # leaves the partition as fine as it gets
+            if round and len(self.classes[round]) == len(
+                    self.classes[round - 1]): break
+
+            round += 1
+
+        if len(self.classes) > round + 1:
+
+            del self.classes[round + 1:], self.sums[round + 1:]
+            for hashes in self.hashes.values(): del hashes[round + 1:]
+
+
+    def count(self, round: int, h: int, change: int):
+
+        classes = self.classes[round]
+        classes[h] = classes.get(h, 0) + change
+        if not classes[h]: del classes[h]
+
+        self.sums[round] = (self.sums[round] + change * h) % MODULUS
+
+
+    def value(self) -> str:
+
+        h = sha256(f"{FINGERPRINT_VERSION} {self.presentation}\n".encode())
+        h.update(self.sums[-1].to_bytes(16, 'big'))
+
+        return h.hexdigest()
+
+# ------------------------------------
+
+# A graph's fingerprint, kept up to date through its listeners. Edits only
+# mark the nodes they touch, which are hashed again when the value is next
+# asked for. Moves don't touch anything without presentation data
+class Fingerprint:
+
+    def __init__(self, graph: Graph, presentation=False):
+
+        # The graph holds on to the tracker through its listeners, not the
+        # other way around, so shared trackers never keep a graph alive
+        self._graph = ref(graph)
+        self.presentation = presentation
+
+        self.refinement = None
+        self.dirty = set()
+
+        graph.subscribe(self.graphChanged)
+
+
+    def graphChanged(self, kind: str, obj):
+
+        # Nothing is tracked until the first value is asked for
+        if self.refinement is None: return
+
+        if kind == 'moves':
+            if self.presentation: self.dirty.update(n.id for n in obj[0])
+
+        elif type(obj) is Node:
+
+            # Conditions on the node's state count it from now on, or no more
+            if kind in ('add', 'remove'):
+                self.dirty.add(obj.id)
+                self.dirty.update(
+                    self.refinement.referrers.get(obj.id, {}).values())
+
+            elif self.presentation: self.dirty.add(obj.id)
+
+        elif type(obj) is Edge:
+
+            if kind == 'move' and not self.presentation: return
+
+            if kind == 'remove': self.refinement.index(obj, removed=True)
+            self.dirty.add(obj.nodes[0].id)
+
+            if kind in ('add', 'remove'): self.dirty.add(obj.nodes[1].id)
+
+
+    @property
+    def graph(self) -> Graph:
+        return self._graph()
+
+    def detach(self):
+        self.graph.unsubscribe(self.graphChanged)
+
+
+    @property
+    def value(self) -> str:
+
+        if self.refinement is None:
+            self.refinement = Refinement(self.graph, self.presentation)
+            self.refinement.update([node.id for node in self.graph.nodes])
+
+        elif self.dirty:
+            self.refinement.update(self.dirty)
+
+        self.dirty = set()
+        return self.refinement.value()
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+def fingerprint(graph: Graph, presentation=False) -> str:
+
+    refinement = Refinement(graph, presentation)
+    refinement.update([node.id for node in graph.nodes])
+
+    return refinement.value()
+
+
+_trackers = WeakKeyDictionary()
+
+# The graph's fingerprint, through trackers shared by every caller
+def fingerprintOf(graph: Graph, presentation=False) -> str:
+
+    trackers = _trackers.setdefault(graph, {})
+
+    if presentation not in trackers:
+        trackers[presentation] = Fingerprint(graph, presentation)
+
+    return trackers[presentation].value
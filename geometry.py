@@ -0,0 +1,260 @@
+"""
+Imports
+"""
+
+# Math
+from numpy import (
+    array, empty, arctan2, sin, cos, trunc, rint, stack, concatenate,
+    flatnonzero
+)
+
+# Data
+from data import Node, Edge
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Everything Canvas.drawEdge needs, in world coordinates, one row per edge.
+# Edges are only marked dirty when something they depend on changes, and all
+# dirty rows are recomputed together in a single NumPy pass
+class EdgeGeometry:
+
+    # Every column and the shape of a single row of it
+    columns = {
+        'calculated': (2,), # Middle point between both nodes
+        'perp': (2,),       # Unit vector perpendicular to the edge
+        'final': (2,),      # Center of the name holder
+        'lines': (2, 4),    # Both segments, node -> name holder
+        'arrow': (3, 2),    # Arrow point, then its left and right corners
+        'label': (4,),      # Name holder rect as x, y, width, height
+        'size': (2,),       # Measured size of the name's text
+    }
+
+    def __init__(self, measure, capacity=64):
+
+        # Callable taking a string and returning its text's (width, height)
+        self.measure = measure
+
+        self.edges: list[Edge] = []
+        self.rows = {}
+        self.names = {} # The name each edge's size was measured for
+
+        self.dirty = set()
+
+        for column, shape in self.columns.items():
+            setattr(self, column, empty((capacity, *shape)))
+
+    # ------------------------------------
+
+    def _grow(self):
+
+        for column in self.columns:
+
+            old = getattr(self, column)
+            new = empty((len(old) * 2, *old.shape[1:]))
+            new[:len(old)] = old
+
+            setattr(self, column, new)
+
+
+    def add(self, edge: Edge):
+
+        if edge in self.rows: return self.invalidate(edge)
+        if len(self.edges) == len(self.calculated): self._grow()
+
+        self.rows[edge] = len(self.edges)
+        self.edges.append(edge)
+        self.dirty.add(edge)
+
+
+    # The last row takes the place of the removed one
+    def remove(self, edge: Edge):
+
+        if edge not in self.rows: return
+
+        row = self.rows.pop(edge)
+        last = self.edges.pop()
+
+        if last is not edge:
+
+            for column in self.columns:
+                c = getattr(self, column)
+                c[row] = c[len(self.edges)]
+
+            self.edges[row] = last
+            self.rows[last] = row
+
+        self.names.pop(edge, None)
+        self.dirty.discard(edge)
+
+
+    def invalidate(self, edge: Edge):
+        if edge in self.rows: self.dirty.add(edge)
+
+
+    def clear(self):
+
+        self.edges.clear()
+        self.rows.clear()
+        self.names.clear()
+        self.dirty.clear()
+
+    # ------------------------------------
+
+    # Positions and radii of the nodes, read straight from their NodeStore
+    # when they all share one, as every node of a graph does
+    @staticmethod
+    def _gather(nodes: list[Node]):
+
+        store = nodes[0].store
+
+        if all(node.store is store for node in nodes):
+            rows = store.rows(nodes)
+            return store.pos[rows], store.radius[rows]
+
+        return (
+            array([node.pos for node in nodes], dtype=float),
+            array([node.radius for node in nodes], dtype=float)
+        )
+
+    # ------------------------------------
+
+    # Recomputes every dirty row and returns the edges that were updated
+    def update(self):
+
+        if not self.dirty: return []
+
+        edges = list(self.dirty)
+        self.dirty.clear()
+
+        rows = array([self.rows[edge] for edge in edges])
+
+        # Renamed edges need their text measured again
+        for edge, row in zip(edges, rows):
+            if self.names.get(edge) != edge.name:
+                self.size[row] = self.measure(edge.name)
+                self.names[edge] = edge.name
+
+        p0, r0 = self._gather([edge.nodes[0] for edge in edges])
+        p1, r1 = self._gather([edge.nodes[1] for edge in edges])
+
+        r0 = (r0 // 2)[:, None]
+        r1 = (r1 // 2)[:, None]
+
+        offset = array([edge.offset for edge in edges], dtype=float)[:, None]
+
+        # ------------------------------------
+        # Name holder
+
+        d = p0 - p1
+        angle = arctan2(d[:, 1], d[:, 0])
+
+        calculated = (p0 + p1 + Node.default_radius) / 2
+        perp = stack((-sin(angle), cos(angle)), axis=1)
+        final = calculated + perp * offset
+
+        # ------------------------------------
+        # Lines, from the nodes' borders to the name holder
+
+        i0, i1 = trunc(p0), trunc(p1)
+
+        d0 = i0 - final
+        d1 = final - i1
+
+        angle0 = arctan2(d0[:, 1], d0[:, 0])
+        angle1 = arctan2(d1[:, 1], d1[:, 0])
+
+        dir0 = stack((cos(angle0), sin(angle0)), axis=1)
+        dir1 = stack((cos(angle1), sin(angle1)), axis=1)
+
+        a0 = i0 - rint(dir0 * r0) + r0
+        a1 = i1 + rint(dir1 * r1) + r1
+
+        lines = stack((
+            stack((a0, final), axis=1).reshape(-1, 4),
+            stack((a1, final), axis=1).reshape(-1, 4)
+        ), axis=1)
+
+        # ------------------------------------
+        # Arrow point
+
+        v = a1 + dir1 * Edge.arrow_height
+        u = stack((-dir1[:, 1], dir1[:, 0]), axis=1)
+
+        arrow = stack((
+            a1, v + u * Edge.arrow_width, v - u * Edge.arrow_width
+        ), axis=1)
+
+        # ------------------------------------
+        # Name holder rect
+
+        w, h = (self.size[rows] * Edge.size_multiplier).T
+        label = stack(
+            (final[:, 0] - w/2, final[:, 1] - h/2, w, h), axis=1)
+
+        # ------------------------------------
+
+        self.calculated[rows] = calculated
+        self.perp[rows] = perp
+        self.final[rows] = final
+        self.lines[rows] = lines
+        self.arrow[rows] = arrow
+        self.label[rows] = label
+
+        return edges
+
+    # ------------------------------------
+
+    # Every point drawn for the given rows, shaped (rows, points, 2)
+    def _points(self, rows):
+
+        x, y, w, h = self.label[rows].T
+        corners = stack((x, y, x + w, y + h), axis=1).reshape(-1, 2, 2)
+
+        return concatenate((
+            self.lines[rows].reshape(len(corners), -1, 2),
+            self.arrow[rows],
+            corners
+        ), axis=1)
+
+
+    # Edges whose bounds intersect the x0, y0, x1, y1 box, out of every edge
+    # in row order or out of the given ones in their order
+    def visible(self, box, edges=None):
+
+        if edges is None:
+            edges, rows = self.edges, slice(len(self.edges))
+
+        else:
+            edges = list(edges)
+            rows = array([self.rows[edge] for edge in edges], dtype=int)
+
+        if not edges: return []
+
+        x0, y0, x1, y1 = box
+        points = self._points(rows)
+
+        low, high = points.min(axis=1), points.max(axis=1)
+
+        inside = (low[:, 0] <= x1) & (high[:, 0] >= x0) &\
+                 (low[:, 1] <= y1) & (high[:, 1] >= y0)
+
+        return [edges[i] for i in flatnonzero(inside)]
+
+
+    # World-space bounds of everything drawn for the edge as x0, y0, x1, y1
+    def bounds(self, edge: Edge):
+
+        points = self._points([self.rows[edge]])[0]
+        return (*points.min(axis=0), *points.max(axis=0))
+
+
+    # Same, for all of the given edges together
+    def extent(self, edges):
+
+        rows = array([self.rows[edge] for edge in edges], dtype=int)
+        points = self._points(rows).reshape(-1, 2)
+
+        return (*points.min(axis=0), *points.max(axis=0))
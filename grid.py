@@ -0,0 +1,310 @@
+"""
+Imports
+"""
+
+# Math
+from numpy import (
+    array, asarray, zeros, ones, ogrid, linspace, rint, flatnonzero, diff,
+    concatenate, min_scalar_type, int8, int32, uint32, empty, frombuffer,
+    load, save, cumsum, searchsorted, float64
+)
+from numpy.random import default_rng
+
+# GUI
+from PyQt5.QtGui import QColor, QImage
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Rows of pixels matched against the palette at once, bounding the size of the
+# (rows, width, colors) distance table
+IMAGE_CHUNK = 64
+
+# Columns drawn per batch by randomGrid, bounding the temporary float array
+RANDOM_CHUNK = 256
+
+# Named brush patterns for the Stamp tool. Truthy cells get painted
+STAMPS = {
+    'Square 3x3': ones((3, 3), dtype=bool),
+    'Square 5x5': ones((5, 5), dtype=bool),
+    'Cross': array((
+        (0, 1, 0),
+        (1, 1, 1),
+        (0, 1, 0),
+    ), dtype=bool),
+    'Ring': array((
+        (0, 1, 1, 1, 0),
+        (1, 0, 0, 0, 1),
+        (1, 0, 0, 0, 1),
+        (1, 0, 0, 0, 1),
+        (0, 1, 1, 1, 0),
+    ), dtype=bool),
+    'Checker 4x4': (ogrid[:4, :1][0] + ogrid[:1, :4][1]) % 2 == 0,
+}
+
+# ------------------------------------------------------------------------------
+"""
+Grid creation & rendering
+"""
+
+# Smallest integer type able to hold `count` states
+def stateType(count: int):
+    return min_scalar_type(max(count - 1, 0))
+
+
+def emptyGrid(width: int, height: int, count: int):
+    return zeros((width, height), dtype=stateType(count))
+
+
+# Every cell drawn independently with probability proportional to `weights`.
+# Equal seeds give equal grids, no seed draws fresh entropy
+def randomGrid(width: int, height: int, weights, seed=None):
+
+    rng = default_rng(seed)
+    out = emptyGrid(width, height, len(weights))
+
+    cumulative = cumsum(weights, dtype=float64)
+
+    if cumulative[-1] <= 0: cumulative = cumsum(ones(len(weights)))
+    cumulative /= cumulative[-1]
+
+    for x in range(0, width, RANDOM_CHUNK):
+
+        u = rng.random((min(RANDOM_CHUNK, width - x), height))
+        out[x:x+RANDOM_CHUNK] = searchsorted(cumulative[:-1], u, side='right')
+
+    return out
+
+
+# Every color as a 0xAARRGGBB word, which is QImage's ARGB32 pixel layout
+def palette(colors):
+
+    return array(
+        [QColor(color).rgba() for color in colors], dtype='uint32'
+    )
+
+
+# Grids are indexed [x, y], images are stored row by row, hence the transpose.
+# The returned buffer must outlive the image, so both are handed back
+def toImage(grid, colors):
+
+    buffer = palette(colors)[grid.T].copy()
+    height, width = buffer.shape
+
+    image = QImage(
+        buffer.data, width, height, width * 4, QImage.Format_ARGB32)
+
+    return image, buffer
+
+# ------------------------------------------------------------------------------
+"""
+Import & export
+"""
+
+def saveImage(grid, colors, filename):
+
+    image, buffer = toImage(grid, colors)
+    return image.save(filename, 'PNG')
+
+
+def _channels(pixels):
+    return [(pixels >> shift & 0xff).astype(int32) for shift in (16, 8, 0)]
+
+
+# Every pixel becomes the state whose color is nearest to it
+def fromImage(image: QImage, colors):
+
+    image = image.convertToFormat(QImage.Format_RGB32)
+    width, height = image.width(), image.height()
+
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+
+    pixels = frombuffer(ptr, dtype=uint32)\
+        .reshape(height, image.bytesPerLine() // 4)[:, :width]
+
+    r, g, b = (c[None, None, :] for c in _channels(palette(colors)))
+    out = empty((height, width), dtype=stateType(len(colors)))
+
+    for y in range(0, height, IMAGE_CHUNK):
+
+        chunk = pixels[y:y+IMAGE_CHUNK]
+        pr, pg, pb = (c[..., None] for c in _channels(chunk))
+
+        out[y:y+IMAGE_CHUNK] = (
+            (pr - r)**2 + (pg - g)**2 + (pb - b)**2
+        ).argmin(axis=2)
+
+    return out.T.copy()
+
+
+def loadImage(filename, colors):
+
+    image = QImage(filename)
+    if image.isNull(): raise ValueError(f"Could not read image {filename}")
+
+    return fromImage(image, colors)
+
+
+def saveArray(grid, filename):
+    save(filename, grid)
+
+
+# Copy-on-write mapping: the file is paged in lazily and never written to
+def loadArray(filename, count: int):
+    return checkGrid(load(filename, mmap_mode='c'), count)
+
+
+# Raises ValueError unless `grid` is a 2D grid of states below `count`
+def checkGrid(grid, count: int):
+
+    if grid.ndim != 2:
+        raise ValueError(f"Expected a 2D array, got {grid.ndim} dimensions")
+
+    if grid.dtype.kind not in 'iu':
+        raise ValueError(f"Expected an integer array, got {grid.dtype}")
+
+    if grid.size and (grid.min() < 0 or grid.max() >= count):
+        raise ValueError(f"States must lie between 0 and {count - 1}")
+
+    return grid
+
+# ------------------------------------------------------------------------------
+"""
+Region tools
+
+All of them paint `value` into `grid` in place, clipping at the borders, and
+return the bounding box of what changed as (x0, y0, x1, y1) or None
+"""
+
+def _clip(grid, x0, y0, x1, y1):
+
+    w, h = grid.shape
+    x0, x1 = max(min(x0, x1), 0), min(max(x0, x1), w - 1)
+    y0, y1 = max(min(y0, y1), 0), min(max(y0, y1), h - 1)
+
+    if x0 > x1 or y0 > y1: return None
+    return x0, y0, x1, y1
+
+
+def fillRect(grid, p0, p1, value):
+
+    box = _clip(grid, *p0, *p1)
+
+    if box is not None:
+        x0, y0, x1, y1 = box
+        grid[x0:x1+1, y0:y1+1] = value
+
+    return box
+
+
+def fillCircle(grid, center, radius, value):
+
+    cx, cy = center
+    radius = max(int(radius), 0)
+    box = _clip(grid, cx - radius, cy - radius, cx + radius, cy + radius)
+
+    if box is not None:
+
+        x0, y0, x1, y1 = box
+        x, y = ogrid[x0:x1+1, y0:y1+1]
+        mask = (x - cx)**2 + (y - cy)**2 <= radius**2 + radius
+
+        grid[x0:x1+1, y0:y1+1][mask] = value
+
+    return box
+
+
+# Used for strokes, so fast mouse motion doesn't leave gaps between samples
+def drawLine(grid, p0, p1, value):
+
+    (x0, y0), (x1, y1) = p0, p1
+    n = max(abs(x1 - x0), abs(y1 - y0)) + 1
+
+    x = rint(linspace(x0, x1, n)).astype(int)
+    y = rint(linspace(y0, y1, n)).astype(int)
+
+    w, h = grid.shape
+    inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    x, y = x[inside], y[inside]
+
+    if not len(x): return None
+
+    grid[x, y] = value
+    return x.min(), y.min(), x.max(), y.max()
+
+
+# Paints the truthy cells of `pattern` centered on `center`. Integer patterns
+# may instead carry their own states, in which case negatives are transparent
+def stamp(grid, pattern, center, value=None):
+
+    pattern = asarray(pattern)
+    pw, ph = pattern.shape
+    ox, oy = center[0] - pw // 2, center[1] - ph // 2
+
+    box = _clip(grid, ox, oy, ox + pw - 1, oy + ph - 1)
+    if box is None: return None
+
+    x0, y0, x1, y1 = box
+    patch = pattern[x0-ox:x1-ox+1, y0-oy:y1-oy+1]
+    target = grid[x0:x1+1, y0:y1+1]
+
+    if value is None:
+        mask = patch >= 0
+        target[mask] = patch[mask]
+
+    else: target[patch.astype(bool)] = value
+
+    return box
+
+
+# Returns the [start, end] pairs of every run of True in a 1D mask
+def _runs(mask):
+
+    edges = diff(concatenate(((False,), mask, (False,))).astype(int8))
+    return zip(flatnonzero(edges == 1), flatnonzero(edges == -1) - 1)
+
+
+# 4-connected scanline fill. Python only iterates over horizontal runs, every
+# run itself is found and painted by NumPy
+def floodFill(grid, point, value):
+
+    x, y = point
+    w, h = grid.shape
+
+    if not (0 <= x < w and 0 <= y < h): return None
+
+    target = grid[x, y]
+    if target == value: return None
+
+    box = [x, y, x, y]
+    seeds = [(x, y)]
+
+    while seeds:
+
+        x, y = seeds.pop()
+        column = grid[:, y]
+
+        if column[x] != target: continue
+
+        # Grow the run to both sides of the seed
+        left = column[:x][::-1] != target
+        right = column[x:] != target
+
+        x0 = x - (left.argmax() if left.any() else x)
+        x1 = x + (right.argmax() if right.any() else w - x) - 1
+
+        column[x0:x1+1] = value
+
+        box[0], box[2] = min(box[0], x0), max(box[2], x1)
+        box[1], box[3] = min(box[1], y), max(box[3], y)
+
+        # Every matching run touching this one on the adjacent lines is a seed
+        for ny in (y - 1, y + 1):
+            if 0 <= ny < h:
+                for start, _ in _runs(grid[x0:x1+1, ny] == target):
+                    seeds.append((x0 + start, ny))
+
+    return tuple(box)
@@ -4,17 +4,28 @@ Imports
 
 # Gui
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QPoint, QLineF, QRectF
+from PyQt5.QtCore import Qt, QPoint, QPointF, QLineF, QRect, QRectF, QTimer
 from PyQt5.QtGui import *
 
 # Misc
-from math import sin, cos, atan2, pi, hypot, acos
-from numpy import matrix, linalg
+from math import ceil, floor, log10
+from collections import defaultdict
+from time import monotonic
 import abc
 
+# Math
+from numpy import array, concatenate, rint, unique, log2, maximum
+
 # Data
 from data import Graph, Node, Edge, find
 from vector import vec, Vector
+from spatial import GridIndex
+from geometry import EdgeGeometry
+from selection import Selection
+from history import (
+    History, MoveCommand, AddCommand, RemoveCommand, EditCommand,
+    nodeState, edgeState, snapshot
+)
 
 # ------------------------------------------------------------------------------
 """
@@ -34,17 +45,139 @@ class Color(QWidget):
 
 # ------------------------------------------------------------------------------
 
+# Calls `callback` at most once every `interval` milliseconds. Requests made
+# in between are merged into a single call, as soon as the interval allows
+class Throttle:
+
+    def __init__(self, callback, interval: int, parent=None):
+
+        self.callback = callback
+        self.interval = interval
+        self.last = float('-inf')
+
+        self.timer = QTimer(parent)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.fire)
+
+
+    def request(self):
+
+        if self.timer.isActive(): return
+
+        wait = self.last + self.interval / 1000 - monotonic()
+        self.timer.start(int(max(wait, 0) * 1000))
+
+
+    # Runs the callback right away if a request is pending
+    def flush(self):
+
+        if self.timer.isActive():
+            self.timer.stop()
+            self.fire()
+
+
+    def fire(self):
+
+        self.last = monotonic()
+        self.callback()
+
+# ------------------------------------------------------------------------------
+
+# Laid out texts and their bounds, so drawing a label skips shaping it again.
+# Entries are keyed by whatever the text belongs to and rebuilt only when the
+# text they're asked for differs from the one they were built with, e.g. once
+# an item is renamed
+class LabelCache:
+
+    def __init__(self, font: QFont):
+
+        self.font = QFont(font)
+        self.metrics = QFontMetricsF(self.font)
+        self.ascent = self.metrics.ascent()
+
+        self.entries = {} # key -> (text, QStaticText, bounds off the baseline)
+
+
+    def get(self, key, text: str):
+
+        entry = self.entries.get(key)
+
+        if entry is None or entry[0] != text:
+
+            static = QStaticText(text)
+            static.setTextFormat(Qt.PlainText)
+            static.prepare(QTransform(), self.font)
+
+            entry = self.entries[key] = (
+                text, static, self.metrics.boundingRect(text))
+
+        return entry
+
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+# ------------------------------------------------------------------------------
+
 # The main drawing frame
 class Canvas(QLabel):
 
     metric_line_size = 5
     text_offset = 5
 
+    # Zooming
+    scale_range = (0.02, 4)
+    zoom_step = 1.25
+
+    # Level of detail. Below lod_detail pixels per node, labels, arrowheads
+    # and antialiasing are dropped and edges sharing the same bundle_size
+    # pixel neighborhoods at both ends get drawn as a single line
+    lod_detail = 12
+    bundle_size = 6
+
+    # Node names are drawn to the right of the node, so nodes this far left of
+    # the view (in world units) may still show up
+    label_margin = 200
+
+    # Milliseconds between scheduled repaints, about one display frame
+    frame_interval = 16
+
     def __init__(self, main, *args, graph: Graph=None,
                  width=800, height=600, **kwargs):
 
         super().__init__(*args, **kwargs)
 
+        # Hit-testing and edge drawing structures, kept in sync through the
+        # graph's listeners
+        self._graph = None
+        self.index = GridIndex()
+        self.labels = LabelCache(self.font())
+        self.edge_geometry = EdgeGeometry(self.measureLabel)
+
+        self.selection = Selection()
+        self.selection.subscribe(self.selectionChanged)
+
+        self.history = History()
+
+        # Rendering layers, see redraw
+        self.background = self.scene = None
+        self.background_key = self.scene_key = None
+
+        # Ruler ticks as paths, see rulerTile
+        self.ruler_tiles = {}
+        self.ruler_labels = LabelCache(QFont(self.font().family(), 6))
+
+        self.dynamic = set()
+        self.dynamic_rect = QRect()
+        self.rubber = None
+
+        # Repaints asked for through schedule, see there
+        self.pending = None
+        self.frame = Throttle(self.flush, self.frame_interval, self)
+
         self.setMinimumWidth(width)
         self.setMinimumHeight(height)
 
@@ -58,9 +191,8 @@ class Canvas(QLabel):
         if graph is None:   self.graph = Graph()
         else:               self.graph = graph
 
-        self._selection = None
-
         self.cam = vec(0, 0)
+        self.scale = 1.0
 
         # ------------------------------------
         # Right-Click menu stuff
@@ -71,9 +203,13 @@ class Canvas(QLabel):
         self.remove = QAction(QIcon.fromTheme('edit-delete'), 'Remove', self)
         self.remove.triggered.connect(self.removeObject)
 
+        self.recolor = QAction(QIcon.fromTheme('color-fill'), 'Color', self)
+        self.recolor.triggered.connect(self.recolorObject)
+
         self.menu = QMenu(self)
         self.menu.addAction(self.edit)
         self.menu.addAction(self.remove)
+        self.menu.addAction(self.recolor)
 
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.contextMenu)
@@ -88,19 +224,14 @@ class Canvas(QLabel):
 
         self.menu_selection = self.getAt(x, y)
 
-        Node.unhighlight()
-        Edge.unhighlight()
-        if self.menu_selection is not None:
+        # Clicking outside the selection replaces it, inside acts on all of it
+        if self.menu_selection not in self.selection:
+            self.selection.set((self.menu_selection,))
 
-            self.edit.setEnabled(True)
-            self.remove.setEnabled(True)
-            self.menu_selection.highlit = True
+        self.edit.setEnabled(self.menu_selection is not None)
+        self.remove.setEnabled(len(self.selection) > 0)
+        self.recolor.setEnabled(len(self.selection.nodes()) > 0)
 
-        else:
-            self.edit.setEnabled(False)
-            self.remove.setEnabled(False)
-
-        self.redraw()
         self.parent().update()
         self.menu.exec_(self.mapToGlobal(e))
 
@@ -112,10 +243,76 @@ class Canvas(QLabel):
 
     def removeObject(self):
 
-        self.graph.remove(self.menu_selection)
+        self.removeSelection()
         self.redraw()
         self.parent().update()
 
+
+    def recolorObject(self):
+
+        nodes = self.selection.nodes()
+        picker = QColorDialog(self)
+        picker.setCurrentColor(QColor(nodes[0].color))
+
+        if picker.exec_():
+            self.recolorSelection(picker.currentColor().name())
+            self.parent().update()
+
+    # ------------------------------------
+    # Bulk operations over the selection
+
+    # Edges go first, as removing a node takes its edges along
+    def removeSelection(self):
+
+        nodes = [n for n in self.selection.nodes() if n.graph is self.graph]
+        edges = dict.fromkeys(
+            e for e in self.selection.edges() if e.graph is self.graph)
+
+        for node in nodes:
+            edges.update(dict.fromkeys(node.outgoing + node.incoming))
+
+        self.selection.clear()
+        if not nodes and not edges: return
+
+        self.history.record(RemoveCommand(
+            [nodeState(node) for node in nodes],
+            [edgeState(edge) for edge in edges]
+        ))
+
+        for edge in edges: self.graph.removeEdge(edge)
+        for node in nodes: self.graph.removeNode(node)
+
+
+    def recolorSelection(self, color: str):
+
+        nodes = self.selection.nodes()
+        before = snapshot(nodes)
+
+        for node in nodes:
+            node.color = color
+            node.notify('edit')
+
+        self.history.record(EditCommand(before, snapshot(nodes)))
+        self.redrawItems(nodes)
+
+
+    # Called once per drag step, the whole drag is undone at once
+    def moveSelection(self, delta):
+
+        nodes = self.selection.nodes()
+
+        self.graph.moveNodes(nodes, delta)
+        self.history.record(
+            MoveCommand([node.id for node in nodes], delta), coalesce=True)
+
+    # ------------------------------------
+
+    def undo(self):
+        if self.history.undo(self.graph): self.schedule()
+
+    def redo(self):
+        if self.history.redo(self.graph): self.schedule()
+
     # ------------------------------------
 
     def setColor(self, color):
@@ -124,8 +321,131 @@ class Canvas(QLabel):
 
     # ------------------------------------
 
+    def getGraph(self):
+        return self._graph
+
+    def setGraph(self, graph: Graph):
+
+        if self._graph is not None:
+            self._graph.unsubscribe(self.graphChanged)
+
+        self.selection.clear()
+        self.history.clear()
+
+        self._graph = graph
+        graph.subscribe(self.graphChanged)
+
+        self.setDynamic(())
+        self.scene_key = None
+
+        self.index.clear()
+        self.edge_geometry.clear()
+        self.labels.clear()
+
+        for node in graph.nodes: self.indexNode(node)
+        for edge in graph.edges: self.edge_geometry.add(edge)
+
+    graph = property(getGraph, setGraph)
+
+    # ------------------------------------
+    # Spatial index maintenance
+
+    def indexNode(self, node: Node):
+
+        x, y = node.pos
+        r = node.radius
+
+        self.index.update(node, (x - r, y - r, x + r, y + r))
+
+
+    def indexEdge(self, edge: Edge):
+
+        x, y = edge.final
+        w, h = 2 * Node.default_radius, Node.default_radius
+
+        self.index.update(edge, (x - w, y - h, x + w, y + h))
+
+
+    def nodeChanged(self, node: Node):
+
+        self.indexNode(node)
+
+        # The edges' name holders follow their nodes
+        for edge in node.outgoing + node.incoming:
+            self.edge_geometry.invalidate(edge)
+
+
+    # Edges are only marked here, their geometry is recalculated in bulk by
+    # updateGeometry right before it's needed
+    def graphChanged(self, kind: str, obj):
+
+        if kind == 'remove':
+
+            self.index.remove(obj)
+            self.labels.discard(obj)
+            self.selection.discard((obj,))
+            if type(obj) is Edge: self.edge_geometry.remove(obj)
+
+        elif kind == 'moves':
+            for node in obj[0]: self.nodeChanged(node)
+
+        elif type(obj) is Node: self.nodeChanged(obj)
+
+        elif type(obj) is Edge:
+            self.edge_geometry.add(obj)
+
+
+    def updateGeometry(self):
+
+        geometry = self.edge_geometry
+
+        for edge in geometry.update():
+
+            row = geometry.rows[edge]
+
+            edge.calculated = vec(*geometry.calculated[row])
+            edge.perp = vec(*geometry.perp[row])
+            edge.final = vec(*geometry.final[row])
+
+            self.indexEdge(edge)
+
+
+    def measureLabel(self, text: str):
+
+        rect = self.labels.metrics.boundingRect(text)
+        return rect.width(), rect.height()
+
+    # ------------------------------------
+
+    # Screen coordinates are world coordinates relative to the camera, scaled
+    def toWorld(self, pos) -> Vector:
+        return pos / self.scale + self.cam
+
+    def toScreen(self, pos) -> Vector:
+        return (pos - self.cam) * self.scale
+
+
+    # The visible part of the world as x0, y0, x1, y1
+    def viewRect(self):
+
+        x, y = self.cam
+        return (
+            x, y, x + self.width() / self.scale, y + self.height() / self.scale
+        )
+
+
+    def detailed(self) -> bool:
+        return Node.default_radius * self.scale >= self.lod_detail
+
+    # ------------------------------------
+
     def addNode(self, x, y):
-        self.graph.addNode(x=x + self.cam.x, y=y + self.cam.y)
+
+        x, y = self.toWorld(vec(x, y))
+        node = self.graph.addNode(x=x, y=y)
+        self.selection.set((node,))
+
+        self.history.record(AddCommand((nodeState(node),), ()))
 
 
     def drawNode(self, painter, node: Node):
@@ -137,10 +457,13 @@ class Canvas(QLabel):
 
         painter.setBrush(QColor(node.color))
 
-        painter.drawEllipse(*(node.pos - self.cam), node.radius, node.radius)
+        x, y = node.pos - self.cam
+        painter.drawEllipse(QRectF(x, y, node.radius, node.radius))
         painter.setBrush(Qt.NoBrush)
 
-        painter.drawText(*(node.pos - self.cam), node.name)
+        # The name stands on the node's top left corner
+        _, text, _ = self.labels.get(node, node.name)
+        painter.drawStaticText(QPointF(x, y - self.labels.ascent), text)
 
     # ------------------------------------
 
@@ -151,174 +474,569 @@ class Canvas(QLabel):
         pen.setWidth(2)
         painter.setPen(pen)
 
-        # ------------------------------------
+        # Every coordinate was precalculated, see EdgeGeometry
+        geometry = self.edge_geometry
+        row = geometry.rows[edge]
+        mx, my = self.cam
 
-        nodes = edge.nodes
+        # Lines
+        for x0, y0, x1, y1 in geometry.lines[row]:
+            painter.drawLine(QLineF(x0 - mx, y0 - my, x1 - mx, y1 - my))
 
-        x0, y0 = (nodes[0].pos).astype(int)
-        x1, y1 = (nodes[1].pos).astype(int)
+        # Arrow Point
+        painter.setBrush(QColor('blue') if edge.highlit else QColor('black'))
+        painter.drawPolygon(QPolygonF([
+            QPointF(x - mx, y - my) for x, y in geometry.arrow[row]
+        ]))
 
-        r0 = nodes[0].radius//2
-        r1 = nodes[1].radius//2
+        # Name holder & Name
+        x, y, w, h = geometry.label[row]
+        rect = QRectF(x - mx, y - my, w, h)
 
-        angle = atan2(y0 - y1, x0 - x1)
+        painter.setBrush(QBrush(QColor('white')))
+        painter.drawRoundedRect(rect, Edge.box_angle, Edge.box_angle)
+        painter.setBrush(Qt.NoBrush)
 
-        # ------------------------------------
-        # Calculating the name holder
+        _, text, _ = self.labels.get(edge, edge.name)
+        size = text.size()
 
-        painter.setBrush(Qt.white)
+        painter.drawStaticText(QPointF(
+            rect.center().x() - size.width() / 2,
+            rect.center().y() - size.height() / 2
+        ), text)
 
-        # Finding the point in the middle
-        edge.calculated = (nodes[0].pos + nodes[1].pos + Node.radius) / 2
 
-        dir = vec(cos(angle), sin(angle)) # Direction vector node0 -> node1
+    # ------------------------------------
 
-        # Perpendicular vector to edge
-        edge.perp = vec(dir @ matrix(((0, 1), (-1, 0))))[0][0]
+    # Ticks every `step` world units, every 10th of them long and labeled.
+    # The step grows tenfold whenever ticks would be less than 5 pixels apart
+    def rulerStep(self) -> int:
+        return 10 ** max(1, ceil(log10(5 / self.scale)))
 
-        x, y = edge.final = edge.calculated + edge.perp * edge.offset
 
-        # ------------------------------------
-        # Calculate the lines
+    # Every tick along an axis `length` pixels long, plus one more period of
+    # 10 ticks, starting at a long one. The ruler draws it shifted by the
+    # camera's offset into that period, so panning never builds it again
+    def rulerTile(self, axis: int, step: int, length: int) -> QPainterPath:
 
-        d = edge.final + vec(Node.radius, Node.radius/2)
+        key = (axis, step, self.scale, length)
+        tile = self.ruler_tiles.get(key)
+        if tile is not None: return tile
 
-        angle0 = atan2(y0 - y, x0 - x)
-        angle1 = atan2(y - y1, x - x1)
+        # Zooming leaves the other scales' tiles behind
+        if len(self.ruler_tiles) > 8: self.ruler_tiles.clear()
 
-        x0 -= round(cos(angle0) * r0)
-        y0 -= round(sin(angle0) * r0)
-        x1 += round(cos(angle1) * r1)
-        y1 += round(sin(angle1) * r1)
+        tile = QPainterPath()
+        size = self.metric_line_size
+        spacing = step * self.scale
 
-        # ------------------------------------
-        # Calculate arrow point
+        for tick in range(ceil(length / spacing) + 11):
 
-        p = vec(x1, y1) + r1
+            p = tick * spacing
+            end = size * (1 + (tick % 10 == 0))
 
-        dir = vec(cos(angle1), sin(angle1))
+            if axis == 0:
+                tile.moveTo(p, 0)
+                tile.lineTo(p, end)
 
-        v = p + dir * Edge.arrow_height
-        u = vec(dir @ matrix(((0, 1), (-1, 0))))[0][0]
+            else:
+                tile.moveTo(0, p)
+                tile.lineTo(end, p)
 
-        left = v + u * Edge.arrow_width
-        right = v - u * Edge.arrow_width
+        self.ruler_tiles[key] = tile
+        return tile
 
-        # ------------------------------------
-        # Now, draw everything
 
+    def drawRuler(self, painter: QPainter):
+
+        painter.setPen(Qt.black)
+        painter.setBrush(Qt.NoBrush)
+        painter.setFont(self.ruler_labels.font)
+
+        step = self.rulerStep()
+        period = step * 10
+        size = self.metric_line_size
+        labels = self.ruler_labels
+
+        for axis, length in enumerate((self.width(), self.height())):
+
+            cam = self.cam[axis]
+            base = floor(cam / period)
+            shift = (base * period - cam) * self.scale
+
+            painter.save()
+
+            if axis == 0:   painter.translate(shift, 0)
+            else:           painter.translate(0, shift)
+
+            painter.drawPath(self.rulerTile(axis, step, length))
+            painter.restore()
+
+            # Long ticks are few, only their labels are drawn one by one
+            last = floor(cam + length / self.scale) // period
+
+            for tick in range(base, last + 1):
+
+                p = (tick * period - cam) * self.scale
+                if p < 0: continue
+
+                text = f"{tick * period}"
+                _, static, _ = labels.get(text, text)
+
+                if axis == 0: point = QPointF(p, size * 2 + self.text_offset)
+                else:         point = QPointF(size * 2, p + self.text_offset)
+
+                painter.drawStaticText(point - QPointF(0, labels.ascent), static)
+
+        # Labels are keyed by their text, which panning keeps bringing in
+        if len(labels.entries) > 1024: labels.clear()
+
+
+    def drawItems(self, painter: QPainter, items):
+
+        nodes = [i for i in items if type(i) is Node]
+        edges = [i for i in items if type(i) is Edge]
+
+        # Edges go over nodes
+        if self.detailed():
+            for node in nodes: self.drawNode(painter, node)
+            for edge in edges: self.drawEdge(painter, edge)
+
+        else:
+            self.drawSimpleNodes(painter, nodes)
+            self.drawBundledEdges(painter, edges)
+
+    # ------------------------------------
+    # Low level of detail drawing
+
+    # Plain rects, batched by color
+    def drawSimpleNodes(self, painter: QPainter, nodes):
+
+        pen = QPen(QColor('black'))
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+
+        store = self.graph.store
+        nodes = [node for node in nodes if node.store is store]
+
+        if not nodes: return
+        rows = store.rows(nodes)
+        batches = defaultdict(list)
+
+        x, y = (store.pos[rows] - self.cam).T
+        r = store.radius[rows]
+        color = [store.palette[i] for i in store.color[rows]]
+
+        for i, lit in enumerate(store.lit[rows]):
+            batches['blue' if lit else color[i]]\
+                .append(QRectF(x[i], y[i], r[i], r[i]))
+
+        for color, rects in batches.items():
+            painter.setBrush(QColor(color))
+            painter.drawRects(rects)
+
+
+    # Straight lines without arrowheads or labels. Edges whose endpoints fall
+    # in the same screen neighborhoods are merged, thicker the more they hold
+    def drawBundledEdges(self, painter: QPainter, edges):
+
+        if not edges: return
+
+        geometry = self.edge_geometry
+        rows = array([geometry.rows[edge] for edge in edges])
+        lit = array([edge.highlit for edge in edges])
+
+        # Start of the first segment, end of the arrow
+        ends = concatenate(
+            (geometry.lines[rows, 0, :2], geometry.arrow[rows, 0]), axis=1)
+
+        q = self.bundle_size / self.scale
+
+        for highlit, color in ((False, 'black'), (True, 'blue')):
+
+            keys = rint(ends[lit == highlit] / q).astype(int)
+            if not len(keys): continue
+
+            # Single edges get hairlines, Qt's fastest pen
+            keys, counts = unique(keys, axis=0, return_counts=True)
+            widths = log2(counts).astype(int)
+
+            for width in unique(widths):
+
+                pen = QPen(QColor(color))
+                pen.setCosmetic(True)
+                pen.setWidth(int(width))
+                painter.setPen(pen)
+
+                lines = keys[widths == width] * q - concatenate((self.cam,)*2)
+                painter.drawLines([QLineF(*line) for line in lines.tolist()])
+
+    # ------------------------------------
+    # Screen-space bounds of what drawNode/drawEdge paint, used as dirty rects
+
+    def itemRect(self, item) -> QRectF:
+
+        if type(item) is Node:
+
+            x, y = item.pos - self.cam
+            r = item.radius
+
+            text = self.labels.get(item, item.name)[2]
+            return self.screenRect(
+                QRectF(x, y, r, r).united(text.translated(x, y)))
+
+        else: return self.edgesRect((item,))
+
+
+    # All edges at once, through their precalculated geometry
+    def edgesRect(self, edges) -> QRectF:
+
+        if not edges: return QRectF()
+
+        x0, y0, x1, y1 = self.edge_geometry.extent(edges)
         mx, my = self.cam
-        # Lines
-        painter.drawLine(x0 + r0 - mx, y0 + r0 - my, x - mx, y - my)
-        painter.drawLine(x1 + r1 - mx, y1 + r1 - my, x - mx, y - my)
 
-        # Arrow Point
-        painter.setBrush(QColor('blue') if edge.highlit else QColor('black'))
-        painter.drawPolygon(
-            QPoint(*(p - self.cam)),
-            QPoint(*(left - self.cam)),
-            QPoint(*(right - self.cam))
-        )
+        return self.screenRect(QRectF(x0 - mx, y0 - my, x1 - x0, y1 - y0))
 
-        # Name holder & Name
-        rect = painter.fontMetrics().boundingRect(edge.name)
 
-        w = rect.width() * Edge.size_multiplier
-        h = rect.height() * Edge.size_multiplier
-        rect = QRectF(x - w/2 - mx, y - h/2 - my, w, h)
+    def screenRect(self, rect: QRectF) -> QRectF:
 
-        painter.setBrush(QBrush(QColor('white')))
-        painter.drawRoundedRect(rect, Edge.box_angle, Edge.box_angle)
-        painter.setBrush(Qt.NoBrush)
-        painter.drawText(rect, Qt.AlignCenter, edge.name)
+        s = self.scale
+
+        return QRectF(
+            rect.x() * s, rect.y() * s, rect.width() * s, rect.height() * s
+        ).adjusted(-3, -3, 3, 3)
 
 
+    def dynamicRect(self) -> QRect:
+
+        rect = self.edgesRect([i for i in self.dynamic if type(i) is Edge])
+
+        for item in self.dynamic:
+            if type(item) is Node: rect = rect.united(self.itemRect(item))
+
+        if type(self.rubber) is QLineF:
+            rect = rect.united(
+                QRectF(self.rubber.p1(), self.rubber.p2()).normalized()\
+                    .adjusted(-3, -3, 3, 3)
+            )
+
+        elif type(self.rubber) is QRectF:
+            rect = rect.united(self.rubber.normalized().adjusted(-3, -3, 3, 3))
+
+        return rect.toAlignedRect()
+
     # ------------------------------------
+    # Layers
+    #
+    # The canvas is composed of the ruler background, the scene (every node
+    # and edge standing still) and the dynamic items (whatever is being
+    # dragged, plus the rubber band), painted straight over the other two.
+    # Dragging only changes the dynamic items, so only the area they cover
+    # gets recomposed, no matter how large the graph is
 
-    def redraw(self):
+    def setDynamic(self, items):
 
-        self.pixmap().fill(self.color)
-        painter = QPainter(self.pixmap())
+        dynamic = set()
+
+        for item in items:
+
+            if item is None: continue
+            dynamic.add(item)
+
+            # The edges of a dragged node move along with it
+            if type(item) is Node:
+                dynamic.update(
+                    e for e in item.outgoing + item.incoming
+                    if e.graph is self.graph
+                )
+
+        if dynamic != self.dynamic:
+            self.dynamic = dynamic
+            self.scene_key = None
+
+
+    # A line while adding edges, a rect while selecting. Screen coordinates
+    def setRubberBand(self, shape=None):
+        self.rubber = shape
+
+
+    def renderBackground(self):
+
+        key = (*self.cam, self.scale, self.width(), self.height())
+        if key == self.background_key: return
+
+        self.background = QPixmap(self.size())
+        self.background.fill(self.color)
+
+        painter = QPainter(self.background)
         painter.setRenderHints(QPainter.Antialiasing|QPainter.TextAntialiasing)
-        painter.setPen(Qt.black)
+        self.drawRuler(painter)
+        painter.end()
 
-        old = painter.font()
-        new = QFont(old)
-        new.setPointSize(6)
-        painter.setFont(new)
+        self.background_key = key
 
-        it = [
-            x - self.cam.x
-            for x in range(self.cam.x, self.cam.x + self.width())
-            if x % 10 == 0
-        ]
 
-        for x in it:
+    def setupPainter(self, painter: QPainter):
 
-            long = (x + self.cam.x) % 100 == 0
-            if long:
-                painter.drawText(
-                    x, self.metric_line_size * 2 + self.text_offset,
-                    f"{x + self.cam.x}"
-                )
+        if self.detailed():
+            painter.setRenderHints(
+                QPainter.Antialiasing|QPainter.TextAntialiasing)
 
-            painter.drawLine(x, 0, x, self.metric_line_size * (long+1))
+        painter.setFont(self.labels.font)
+        painter.scale(self.scale, self.scale)
 
-        it = [
-            y - self.cam.y
-            for y in range(self.cam.y, self.cam.y + self.height())
-            if y % 10 == 0
-        ]
 
-        for y in it:
+    # When only the camera moved, by less than the canvas' size, the scene is
+    # scrolled in place and only the strips it uncovers get drawn
+    def renderScene(self):
 
-            long = (y + self.cam.y) % 100 == 0
-            if long:
-                painter.drawText(
-                    self.metric_line_size * 2,
-                    y + self.text_offset, f"{y + self.cam.y}"
-                )
+        key = (*self.cam, self.scale, self.width(), self.height())
+        if key == self.scene_key: return
 
-            painter.drawLine(0, y, self.metric_line_size * (long+1), y)
+        shift = self.scrollShift(self.scene_key, key)
 
-        # ------------------------------------
+        if shift is None:
+            self.scene = QPixmap(self.size())
+            self.scene.fill(Qt.transparent)
+            self.paintScene(self.scene.rect())
+
+        else:
+
+            dx, dy = shift
+            w, h = self.width(), self.height()
+
+            self.scene.scroll(-dx, -dy, self.scene.rect())
 
-        painter.setFont(old)
+            strips = []
+            if dx: strips.append(QRect(w - dx if dx > 0 else 0, 0, abs(dx), h))
+            if dy: strips.append(QRect(0, h - dy if dy > 0 else 0, w, abs(dy)))
 
-        for node in self.graph.nodes:
-            self.drawNode(painter, node)
+            self.paintScene(*strips)
 
-        for edge in self.graph.edges:
-            self.drawEdge(painter, edge)
+        self.scene_key = key
+
+
+    # How many whole pixels the scene's contents move by between both keys,
+    # or None if it has to be drawn anew
+    def scrollShift(self, old, new):
+
+        if old is None or old[2:] != new[2:]: return None
+
+        s, w, h = new[2:]
+        dx, dy = (new[0] - old[0]) * s, (new[1] - old[1]) * s
+
+        if abs(dx - round(dx)) > 1e-3 or abs(dy - round(dy)) > 1e-3: return None
+        if abs(dx) >= w or abs(dy) >= h: return None
+
+        return round(dx), round(dy)
+
+
+    # Clears the rects of the scene and draws everything standing there, in a
+    # single pass. Only what intersects them gets drawn: nodes are found
+    # through the node store, edges through their precalculated bounds
+    def paintScene(self, *rects: QRect):
+
+        if not rects: return
+
+        s, (mx, my) = self.scale, self.cam
+        m = self.label_margin
+
+        nodes, edges = {}, {}
+
+        for rect in rects:
+
+            x0, y0 = rect.left() / s + mx, rect.top() / s + my
+            x1, y1 = (rect.right() + 1) / s + mx, (rect.bottom() + 1) / s + my
+
+            nodes.update(dict.fromkeys(
+                self.graph.store.within((x0 - m, y0 - m, x1, y1))))
+            edges.update(dict.fromkeys(
+                self.edge_geometry.visible((x0, y0, x1, y1))))
+
+        region = QRegion()
+        for rect in rects: region = region.united(rect)
+
+        painter = QPainter(self.scene)
+
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for rect in rects: painter.fillRect(rect, Qt.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+
+        painter.setClipRegion(region)
+        self.setupPainter(painter)
+
+        self.drawItems(painter, [n for n in nodes if n not in self.dynamic])
+        self.drawItems(painter, [e for e in edges if e not in self.dynamic])
 
         painter.end()
 
 
+    def compose(self, rect: QRect):
+
+        painter = QPainter(self.pixmap())
+        painter.setClipRect(rect)
+
+        painter.drawPixmap(rect, self.background, rect)
+        painter.drawPixmap(rect, self.scene, rect)
+
+        # Dragging many nodes may take edges leading far out of view along
+        x0, y0, x1, y1 = self.viewRect()
+        m = self.label_margin
+
+        painter.save()
+        self.setupPainter(painter)
+        self.drawItems(painter, [
+            i for i in self.dynamic if type(i) is Node
+            and x0 - m <= i.pos[0] <= x1 and y0 - m <= i.pos[1] <= y1
+        ] + self.edge_geometry.visible(
+            self.viewRect(), (i for i in self.dynamic if type(i) is Edge)
+        ))
+        painter.restore()
+
+        if type(self.rubber) is QLineF:
+
+            pen = QPen()
+            pen.setColor(QColor('blue'))
+            pen.setWidth(3)
+            painter.setPen(pen)
+
+            painter.drawLine(self.rubber)
+
+        elif type(self.rubber) is QRectF:
+
+            painter.setPen(QColor('blue'))
+            painter.setBrush(QColor(0, 0, 255, 32))
+            painter.drawRect(self.rubber.normalized())
+
+        painter.end()
+        self.update(rect)
+
+    # ------------------------------------
+
+    # Anything may have changed: repaint the scene and the whole canvas
+    def redraw(self):
+
+        self.scene_key = None
+        self.redrawView()
+
+
+    # Only the camera moved: the scene is reused as far as it can be
+    def redrawView(self):
+
+        self.updateGeometry()
+
+        self.renderBackground()
+        self.renderScene()
+
+        self.dynamic_rect = self.dynamicRect()
+        self.compose(self.pixmap().rect())
+
+
+    # Only the given items' looks changed: repaint the scene where they are
+    # drawn, along with everything else standing there
+    def redrawItems(self, items):
+
+        key = (*self.cam, self.scale, self.width(), self.height())
+        if key != self.scene_key: return # The next redraw repaints it all
+
+        self.updateGeometry()
+
+        items = [i for i in items if i.graph is self.graph]
+        rect = self.edgesRect([i for i in items if type(i) is Edge])
+
+        for item in items:
+            if type(item) is Node: rect = rect.united(self.itemRect(item))
+
+        rect = rect.toAlignedRect().intersected(self.scene.rect())
+        if rect.isEmpty(): return
+
+        self.paintScene(rect)
+        self.compose(rect)
+
+
+    def selectionChanged(self, changed: set):
+        self.redrawItems(changed)
+
+
+    # Asks for a repaint of the given kind on the next frame. Any number of
+    # requests until then become a single one, of the broadest kind asked
+    def schedule(self, kind='full'):
+
+        kinds = ('dynamic', 'view', 'full')
+
+        if self.pending is None or kinds.index(kind) > kinds.index(self.pending):
+            self.pending = kind
+
+        self.frame.request()
+
+
+    def flush(self):
+
+        pending, self.pending = self.pending, None
+
+        if   pending == 'full':     self.redraw()
+        elif pending == 'view':     self.redrawView()
+        elif pending == 'dynamic':  self.redrawDynamic()
+
+
+    # Only the dynamic items changed: recompose where they were and are
+    def redrawDynamic(self):
+
+        self.updateGeometry()
+        self.renderBackground()
+        self.renderScene()
+
+        rect = self.dynamicRect()
+        self.compose(rect.united(self.dynamic_rect))
+
+        self.dynamic_rect = rect
+
+
     def getAt(self, pos, y=None):
 
         if y is not None: pos = vec(pos, y)
         if type(pos) is not Vector:
             raise TypeError(f"Expected int or Vector, not {type(pos)}")
 
-        pos += self.cam
+        pos = self.toWorld(pos)
+        self.updateGeometry()
 
-        for node in self.graph.nodes:
+        # Nodes take precedence over edges
+        found = self.index.query(*pos)
 
-            if  (pos > node.pos - node.radius).all() and\
-                (pos < node.pos + node.radius).all():
+        return find(found, lambda i: type(i) is Node) or\
+               find(found, lambda i: type(i) is Edge)
 
-                return node
+    # Every node and edge whose hit box touches the rect between both
+    # screen points
+    def getIn(self, p0, p1):
 
+        (x0, y0), (x1, y1) = self.toWorld(p0), self.toWorld(p1)
+        self.updateGeometry()
 
-        v = vec(2, 1) * Node.radius
-        for edge in self.graph.edges:
+        return self.index.queryRect(
+            (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
 
-            if (pos > edge.final - v).all() and\
-               (pos < edge.final + v).all():
+    # ------------------------------------
 
-               return edge
+    # Zooms around the point under the cursor
+    def wheelEvent(self, e):
 
-        return None
+        steps = e.angleDelta().y() / 120
+        if not steps: return
+
+        scale = min(max(
+            self.scale * self.zoom_step ** steps, self.scale_range[0]
+        ), self.scale_range[1])
+
+        mouse = vec(e.x(), e.y())
+        anchor = self.toWorld(mouse)
+
+        self.scale = scale
+        self.cam = maximum(anchor - mouse / scale, 0)
+
+        self.schedule('view')
 
     # ------------------------------------
 
@@ -334,16 +1052,6 @@ class Canvas(QLabel):
 
     # ------------------------------------
 
-    def unhighlight(self):
-
-        for node in self.graph.nodes:
-            node.setHighlight(False)
-
-        for edge in self.graph.edges:
-            edge.setHighlight(False)
-
-    # ------------------------------------
-
     def __getattr__(self, attr):
         # For graph operations, deal directly with the graph
 
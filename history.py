@@ -0,0 +1,324 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph, Node, Edge, Op
+from collections import deque
+
+# Math
+from numpy import array, ndarray
+
+# Misc
+from sys import getsizeof
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Bytes of history kept around before the oldest commands are dropped
+HISTORY_LIMIT = 32 << 20
+
+# ------------------------------------------------------------------------------
+"""
+Serialization
+
+Commands never hold on to nodes or edges. They keep plain tuples and refer to
+items by id, which stays the same when a deleted item is brought back
+"""
+
+def nodeState(node: Node) -> tuple:
+    return (node.id, node.name, *node.pos.tolist(), node.color)
+
+
+def edgeState(edge: Edge) -> tuple:
+
+    return (
+        edge.id, edge.nodes[0].id, edge.nodes[1].id, edge.name,
+        edge.probability, float(edge.offset), edge.priority,
+        tuple((c.state, c.op.value, c.amnt) for c in edge.conditions)
+    )
+
+
+# Tagged states of nodes and edges, as taken before and after an edit
+def snapshot(items) -> tuple:
+
+    return tuple(
+        ('node', nodeState(item)) if type(item) is Node
+        else ('edge', edgeState(item))
+        for item in items
+    )
+
+# ------------------------------------
+
+def restoreNode(graph: Graph, state: tuple) -> Node:
+
+    id, name, x, y, color = state
+
+    node = Node(x, y, name)
+    node.id = id
+    node.color = color
+
+    graph.addNode(node, newid=False)
+    return node
+
+
+def restoreEdge(graph: Graph, state: tuple) -> Edge:
+
+    src = graph.getNode(state[1])
+
+    edge = Edge(src, graph.getNode(state[2]))
+    edge.id = state[0]
+    updateEdge(edge, state, notify=False)
+
+    src.outgoing.sort(key=Node.edgeReorder)
+    graph.addEdge(edge, newid=False)
+
+    return edge
+
+
+def updateNode(node: Node, state: tuple):
+
+    _, node.name, x, y, node.color = state
+
+    node.pos = (x, y)
+    node.notify('edit')
+
+
+def updateEdge(edge: Edge, state: tuple, notify=True):
+
+    _, _, _, edge.name, edge.probability, edge.offset, edge.priority,\
+        conditions = state
+
+    edge.conditions.clear()
+    for s, op, amnt in conditions: edge.addCondition(s, Op(op), amnt)
+
+    if notify:
+        edge.nodes[0].outgoing.sort(key=Node.edgeReorder)
+        edge.notify('edit')
+
+
+def restore(graph: Graph, states: tuple):
+
+    for kind, state in states:
+
+        if kind == 'node':  updateNode(graph.getNode(state[0]), state)
+        else:               updateEdge(graph.getEdge(state[0]), state)
+
+# ------------------------------------
+
+# Rough memory footprint of plain, nested data
+def sizeOf(obj) -> int:
+
+    if type(obj) is ndarray: return obj.nbytes
+    if type(obj) in (tuple, list):
+        return getsizeof(obj) + sum(sizeOf(i) for i in obj)
+
+    return getsizeof(obj)
+
+# ------------------------------------------------------------------------------
+"""
+Commands
+
+Each knows how to undo and redo itself on a graph, and how big it is.
+Commands of one continuous gesture (e.g. a drag) may merge into one
+"""
+
+class Command:
+
+    def undo(self, graph: Graph): pass
+    def redo(self, graph: Graph): pass
+
+    def merge(self, other) -> bool:
+        return False
+
+    def size(self) -> int:
+        return getsizeof(self) + sizeOf(tuple(vars(self).values()))
+
+# ------------------------------------
+
+# Nodes translated, either all by the same (2,) delta or each by its own row
+# of an (n, 2) one
+class MoveCommand(Command):
+
+    def __init__(self, ids, delta):
+        self.ids = array(ids, dtype=int)
+        self.delta = array(delta, dtype=float)
+
+
+    def nodes(self, graph: Graph):
+        return [graph.getNode(id) for id in self.ids.tolist()]
+
+    def undo(self, graph: Graph):
+        graph.moveNodes(self.nodes(graph), -self.delta)
+
+    def redo(self, graph: Graph):
+        graph.moveNodes(self.nodes(graph), self.delta)
+
+
+    def merge(self, other) -> bool:
+
+        if type(other) is not MoveCommand: return False
+        if len(other.ids) != len(self.ids) or (other.ids != self.ids).any():
+            return False
+
+        self.delta = self.delta + other.delta
+        return True
+
+
+class OffsetCommand(Command):
+
+    def __init__(self, id: int, before: float, after: float):
+        self.id = id
+        self.before = float(before)
+        self.after = float(after)
+
+
+    def undo(self, graph: Graph):
+        graph.getEdge(self.id).offset = self.before
+
+    def redo(self, graph: Graph):
+        graph.getEdge(self.id).offset = self.after
+
+
+    def merge(self, other) -> bool:
+
+        if type(other) is not OffsetCommand or other.id != self.id:
+            return False
+
+        self.after = other.after
+        return True
+
+# ------------------------------------
+
+# Nodes and edges brought into the graph, as states. Nodes come first when
+# adding, edges first when removing
+class AddCommand(Command):
+
+    def __init__(self, nodes: tuple, edges: tuple):
+        self.nodes = tuple(nodes)
+        self.edges = tuple(edges)
+
+
+    def add(self, graph: Graph):
+        for state in self.nodes: restoreNode(graph, state)
+        for state in self.edges: restoreEdge(graph, state)
+
+    def remove(self, graph: Graph):
+        for state in self.edges: graph.removeEdge(graph.getEdge(state[0]))
+        for state in self.nodes: graph.removeNode(graph.getNode(state[0]))
+
+    undo = remove
+    redo = add
+
+
+# A whole subgraph taken out, every edge touching its nodes included
+class RemoveCommand(AddCommand):
+
+    undo = AddCommand.add
+    redo = AddCommand.remove
+
+
+class EditCommand(Command):
+
+    def __init__(self, before: tuple, after: tuple):
+        self.before = before
+        self.after = after
+
+
+    def undo(self, graph: Graph):
+        restore(graph, self.before)
+
+    def redo(self, graph: Graph):
+        restore(graph, self.after)
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Undo and redo stacks. While a gesture is open, commands recorded with
+# `coalesce` merge into the last one, until seal() closes it. Whenever the
+# stacks grow past `limit` bytes, the oldest commands are forgotten
+class History:
+
+    def __init__(self, limit=HISTORY_LIMIT):
+
+        self.limit = limit
+
+        self.undos = deque() # (command, size)
+        self.redos = []
+        self.size = 0
+
+        self.open = False
+
+    # ------------------------------------
+
+    def record(self, command: Command, coalesce=False):
+
+        for _, size in self.redos: self.size -= size
+        self.redos.clear()
+
+        if coalesce and self.open and self.undos and\
+           self.undos[-1][0].merge(command):
+
+            last, size = self.undos.pop()
+            self.size -= size
+            command = last
+
+        size = command.size()
+        self.undos.append((command, size))
+        self.size += size
+
+        self.open = coalesce
+
+        # The latest command is always kept, however big
+        while self.size > self.limit and len(self.undos) > 1:
+            self.size -= self.undos.popleft()[1]
+
+
+    def seal(self):
+        self.open = False
+
+
+    def clear(self):
+
+        self.undos.clear()
+        self.redos.clear()
+        self.size = 0
+        self.open = False
+
+    # ------------------------------------
+
+    def canUndo(self) -> bool:
+        return len(self.undos) > 0
+
+    def canRedo(self) -> bool:
+        return len(self.redos) > 0
+
+
+    def undo(self, graph: Graph) -> bool:
+
+        if not self.undos: return False
+
+        self.open = False
+        entry = self.undos.pop()
+
+        entry[0].undo(graph)
+        self.redos.append(entry)
+
+        return True
+
+
+    def redo(self, graph: Graph) -> bool:
+
+        if not self.redos: return False
+
+        self.open = False
+        entry = self.redos.pop()
+
+        entry[0].redo(graph)
+        self.undos.append(entry)
+
+        return True
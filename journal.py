@@ -0,0 +1,399 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph, Node, Edge
+from history import nodeState, edgeState, restoreNode, restoreEdge
+import json
+
+# Misc
+from threading import Thread
+from queue import Queue, Empty
+from time import monotonic
+from glob import glob
+import os
+
+# Locks, which differ per platform
+if os.name == 'nt': import msvcrt
+else: import fcntl
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.ac-designer')
+
+# Seconds the writer waits gathering records before writing them out
+JOURNAL_INTERVAL = 1
+
+# Records appended before the journal is rewritten as a single snapshot
+COMPACT_RECORDS = 20000
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+
+A journal is a text file of JSON records, one per line. It starts with a
+snapshot of the whole graph, and every later line adds, updates or removes a
+single node or edge, or moves many nodes at once:
+
+    ["s", [node states], [edge states]]
+    ["n", node state]       ["-n", id]
+    ["e", edge state]       ["-e", id]
+    ["t", [ids], dx, dy]    ["p", [ids], [positions]]
+
+States are the ones history.py takes for undo, so a record costs as much as
+the edit it stands for, whatever the size of the graph. The writer thread
+keeps its own copy of the states, which compacting rewrites the journal
+from, so the GUI thread only ever takes a snapshot when a graph is attached.
+
+Every running instance journals to a file of its own, and holds a lock on
+it for as long as it runs. A journal nobody holds the lock on was left
+behind by an instance that didn't end cleanly
+"""
+
+class Journal:
+
+    def __init__(self, path=None, interval=JOURNAL_INTERVAL,
+                 compact=COMPACT_RECORDS):
+
+        self.path = path or journalPath()
+        self.interval = interval
+        self.compact_records = compact
+
+        self.graph = None
+
+        # Records travel to the writer thread through the queue, None asks
+        # it to write what it has right away and False to stop
+        self.queue = Queue()
+        self.flushed = Queue()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        self.lock = open(self.path + '.lock', 'a')
+        lock(self.lock)
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # ------------------------------------
+
+    # Starts journaling the graph anew, from a snapshot of it
+    def attach(self, graph: Graph):
+
+        if self.graph is not None: self.graph.unsubscribe(self.graphChanged)
+
+        self.graph = graph
+        graph.subscribe(self.graphChanged)
+
+        self.compact()
+
+
+    def compact(self):
+
+        self.queue.put(['s',
+            [nodeState(node) for node in self.graph.nodes],
+            [edgeState(edge) for edge in self.graph.edges]
+        ])
+
+
+    def graphChanged(self, kind: str, obj):
+
+        if kind == 'remove':
+            record = ['-n' if type(obj) is Node else '-e', obj.id]
+
+        # Nodes moved together make a single record. Positions are copied
+        # as an array, and only turned into lists by the writer
+        elif kind == 'moves':
+
+            nodes, delta = obj
+            ids = [node.id for node in nodes]
+
+            if delta is not None: record = ['t', ids, *map(float, delta)]
+
+            else:
+                store = self.graph.store
+                record = ['p', ids, store.pos[store.rows(nodes)]]
+
+        elif type(obj) is Node:     record = ['n', nodeState(obj)]
+        elif type(obj) is Edge:     record = ['e', edgeState(obj)]
+
+        else: return
+
+        self.queue.put(record)
+
+    # ------------------------------------
+
+    # Blocks until everything recorded so far is on disk
+    def flush(self):
+
+        self.queue.put(None)
+        self.flushed.get()
+
+
+    # A clean shutdown leaves no journal behind to be recovered
+    def close(self, discard=True):
+
+        if self.graph is not None: self.graph.unsubscribe(self.graphChanged)
+        self.graph = None
+
+        self.queue.put(False)
+        self.thread.join()
+
+        if discard and os.path.exists(self.path): os.remove(self.path)
+
+        self.lock.close()
+        removeQuietly(self.path + '.lock')
+
+    # ------------------------------------
+    # Writer thread
+
+    def run(self):
+
+        file = None
+        running = True
+
+        # The graph as the journal has it, and records since its snapshot
+        nodes, edges = {}, {}
+        records_written = 0
+
+        while running:
+
+            batch = [self.queue.get()]
+            deadline = monotonic() + self.interval
+
+            # Whatever else arrives within the interval is written along
+            try:
+                while batch[-1]:
+                    batch.append(self.queue.get(
+                        timeout=max(deadline - monotonic(), 0)))
+
+            except Empty: pass
+
+            running = batch[-1] is not False
+            records = [record for record in batch if record]
+
+            # Only the last snapshot matters, and what came after it
+            for i in reversed(range(len(records))):
+
+                if records[i][0] == 's':
+
+                    apply(nodes, edges, records[i])
+
+                    if file is not None: file.close()
+                    file = self.rewrite(records[i])
+
+                    records = records[i + 1:]
+                    records_written = 0
+                    break
+
+            records = squash(records)
+            for record in records: apply(nodes, edges, record)
+
+            records_written += len(records)
+
+            if file is not None and records_written >= self.compact_records:
+
+                file.close()
+                file = self.rewrite(
+                    ['s', list(nodes.values()), list(edges.values())])
+
+                records_written = 0
+
+            elif file is not None and records:
+                file.writelines(
+                    json.dumps(encoded(record)) + '\n' for record in records)
+
+            if file is not None:
+                file.flush()
+                os.fsync(file.fileno())
+
+            if batch[-1] is None: self.flushed.put(True)
+
+        if file is not None: file.close()
+
+
+    # A new journal holding only the snapshot. It replaces the old one in a
+    # single step, so a crash midway leaves either of them whole
+    def rewrite(self, snapshot):
+
+        temporary = self.path + '.tmp'
+
+        with open(temporary, 'w') as f:
+            f.write(json.dumps(snapshot) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary, self.path)
+        return open(self.path, 'a')
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# Only each node's or edge's latest record within a batch is kept, in the
+# order of those latest records. Bulk moves stay where they are, but one
+# right after another over the same nodes merges into it, as drags do
+def squash(records):
+
+    latest = {}
+
+    for i, record in enumerate(records):
+
+        kind = record[0]
+
+        if kind in ('t', 'p'):
+
+            key, last = (kind, i), None
+            if latest: last = next(reversed(latest.values()))
+
+            if last is not None and last[0] == kind and last[1] == record[1]:
+
+                latest.pop(next(reversed(latest)))
+
+                if kind == 't':
+                    record = ['t', record[1],
+                              last[2] + record[2], last[3] + record[3]]
+
+        else: key = (kind.lstrip('-'), record[1] if kind[0] == '-'
+                     else record[1][0])
+
+        latest.pop(key, None)
+        latest[key] = record
+
+    return list(latest.values())
+
+
+# A record as it's written out
+def encoded(record):
+
+    if record[0] == 'p': return ['p', record[1], record[2].tolist()]
+    return record
+
+
+# Brings node and edge states, by id, up to date with a record. Moves of
+# nodes that don't exist (yet) are ignored
+def apply(nodes: dict, edges: dict, record):
+
+    kind, item, *rest = record
+
+    if kind == 's':
+        nodes.clear()
+        edges.clear()
+        nodes.update((state[0], list(state)) for state in item)
+        edges.update((state[0], list(state)) for state in rest[0])
+
+    elif kind == 'n':   nodes[item[0]] = list(item)
+    elif kind == 'e':   edges[item[0]] = list(item)
+    elif kind == '-n':  nodes.pop(item, None)
+    elif kind == '-e':  edges.pop(item, None)
+
+    elif kind == 't':
+
+        dx, dy = rest
+
+        for id in item:
+            if id in nodes: nodes[id][2] += dx; nodes[id][3] += dy
+
+    elif kind == 'p':
+
+        for id, (x, y) in zip(item, rest[0]):
+            if id in nodes: nodes[id][2:4] = float(x), float(y)
+
+
+# The graph a journal left behind, or None if there's no journal. Only the
+# last line may have been cut short by a crash, anything unreadable ends it
+def recover(path: str):
+
+    if not os.path.exists(path): return None
+
+    nodes, edges = {}, {}
+
+    with open(path) as f:
+
+        for line in f:
+
+            try: record = json.loads(line)
+            except ValueError: break
+
+            apply(nodes, edges, record)
+
+    g = Graph()
+
+    for state in nodes.values(): restoreNode(g, state)
+
+    for state in edges.values():
+        if state[1] in nodes and state[2] in nodes: restoreEdge(g, state)
+
+    g.next_id = max(nodes, default=-1) + 1
+    g.next_edge_id = max(edges, default=-1) + 1
+
+    return g
+
+
+# Each running instance journals to its own file
+def journalPath(directory=JOURNAL_DIR, pid=None) -> str:
+
+    if pid is None: pid = os.getpid()
+    return os.path.join(directory, f'autosave-{pid}.journal')
+
+
+# Takes an exclusive lock on an open file, False if someone else holds it.
+# The lock goes away with the file, or the process
+def lock(file) -> bool:
+
+    try:
+        if os.name == 'nt': msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else: fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    except OSError: return False
+
+    return True
+
+
+def removeQuietly(path: str):
+
+    try: os.remove(path)
+    except OSError: pass
+
+
+# Journals left behind by instances no longer running, newest first
+def staleJournals(directory=JOURNAL_DIR) -> list[str]:
+
+    stale = []
+
+    for path in glob(os.path.join(directory, 'autosave*.journal')):
+
+        with open(path + '.lock', 'a') as f:
+            if not lock(f): continue
+
+        try: stale.append((os.path.getmtime(path), path))
+        except OSError: pass
+
+    return [path for _, path in sorted(stale, reverse=True)]
+
+
+# Takes a stale journal over and reads its graph back, None if another
+# instance took it first. The journal is gone afterwards either way
+def reclaim(path: str):
+
+    claimed = journalPath(os.path.dirname(path)) + '.recovered'
+
+    # Only one instance can move the journal away
+    try: os.replace(path, claimed)
+    except OSError: return None
+
+    try: return recover(claimed)
+
+    finally:
+        os.remove(claimed)
+        removeQuietly(path + '.lock')
+
+
+def discard(path: str):
+
+    removeQuietly(path)
+    removeQuietly(path + '.lock')
@@ -0,0 +1,227 @@
+"""
+Imports
+"""
+
+# Math
+from numpy import (
+    array, asarray, zeros, bincount, flatnonzero, argsort, cumsum, minimum,
+    maximum, sqrt, inf, fill_diagonal, errstate, linspace, quantile,
+    searchsorted
+)
+from numpy.random import default_rng
+
+# GUI
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Data
+from data import Graph, Node
+
+# Misc
+from time import time
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+# Node/cell pairs evaluated at once by the far field, bounding the size of the
+# temporary (nodes, cells, 2) array
+PAIR_CHUNK = 1 << 20
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Fruchterman-Reingold layout over plain arrays: nodes repel each other, edges
+# pull their ends together and a slowly cooling temperature caps how far any
+# node moves per step.
+#
+# Repulsion is approximated over a grid of about sqrt(n) cells. Nodes
+# sharing a cell repel each other exactly, every other cell acts as a single
+# body at its center of mass. That makes a step O(n sqrt(n)) instead of O(n²)
+class ForceLayout:
+
+    cooling = 0.95
+    gravity = 0.01
+
+    def __init__(self, pos, edges, spacing=3*Node.default_radius, seed=None):
+
+        self.pos = array(pos, dtype=float).reshape(-1, 2)
+        self.k = spacing
+
+        # Self loops exert no force
+        edges = asarray(edges, dtype=int).reshape(-1, 2)
+        self.edges = edges[edges[:, 0] != edges[:, 1]]
+
+        n = len(self.pos)
+
+        self.temperature = spacing * max(sqrt(n), 1) / 4
+        self.threshold = spacing / 50
+
+        # Coincident nodes would feel no force pulling them apart
+        self.pos += default_rng(seed).uniform(-1, 1, self.pos.shape)
+
+    # ------------------------------------
+
+    @property
+    def converged(self) -> bool:
+        return self.temperature < self.threshold or len(self.pos) < 2
+
+
+    def repulsion(self):
+
+        pos = self.pos
+        n = len(pos)
+        force = zeros((n, 2))
+
+        # Cell boundaries lie at quantiles of each axis, so every row and column
+        # of cells holds about as many nodes, however clustered they are
+        side = max(int(n ** 0.25), 1)
+        q = linspace(0, 1, side + 1)[1:-1]
+
+        ids = searchsorted(quantile(pos[:, 0], q), pos[:, 0]) * side +\
+              searchsorted(quantile(pos[:, 1], q), pos[:, 1])
+
+        count = bincount(ids, minlength=side * side)
+        occupied = flatnonzero(count)
+        mass = count[occupied]
+
+        center = array((
+            bincount(ids, pos[:, 0], side * side)[occupied],
+            bincount(ids, pos[:, 1], side * side)[occupied]
+        )).T / mass[:, None]
+
+        # Far field, every node against every other cell's center of mass
+        chunk = max(PAIR_CHUNK // len(occupied), 1)
+
+        for i in range(0, n, chunk):
+
+            d = pos[i:i+chunk, None, :] - center[None, :, :]
+            weight = mass / maximum((d ** 2).sum(axis=2), 1e-9)
+            weight[ids[i:i+chunk, None] == occupied[None, :]] = 0
+
+            force[i:i+chunk] = (d * weight[..., None]).sum(axis=1)
+
+        # Near field, exactly between the nodes of each cell
+        order = argsort(ids, kind='stable')
+        ends = cumsum(count)
+
+        for c in occupied[mass > 1]:
+
+            members = order[ends[c] - count[c]:ends[c]]
+            d = pos[members, None, :] - pos[None, members, :]
+
+            dist = (d ** 2).sum(axis=2)
+            fill_diagonal(dist, inf)
+
+            force[members] += (d / maximum(dist, 1e-9)[..., None]).sum(axis=1)
+
+        return force * self.k ** 2
+
+
+    def attraction(self):
+
+        n = len(self.pos)
+        if not len(self.edges): return zeros((n, 2))
+
+        a, b = self.edges.T
+        d = self.pos[a] - self.pos[b]
+        pull = d * sqrt((d ** 2).sum(axis=1))[:, None] / self.k
+
+        return array([
+            bincount(b, pull[:, axis], n) - bincount(a, pull[:, axis], n)
+            for axis in range(2)
+        ]).T
+
+
+    # Moves every node once and cools down. Returns the largest displacement
+    def step(self) -> float:
+
+        if self.converged: return 0.0
+
+        force = self.repulsion() + self.attraction()
+        force -= (self.pos - self.pos.mean(axis=0)) * self.gravity
+
+        length = sqrt((force ** 2).sum(axis=1))
+        capped = minimum(length, self.temperature)
+
+        with errstate(invalid='ignore', divide='ignore'):
+            displacement = force * (capped / length)[:, None]
+
+        displacement[length == 0] = 0
+        self.pos += displacement
+
+        self.temperature *= self.cooling
+        return capped.max()
+
+    # ------------------------------------
+
+    # The layout shifted so that every node lies at least one spacing away
+    # from the world's origin, where the canvas can reach it
+    def positions(self):
+        return self.pos - self.pos.min(axis=0) + self.k
+
+# ------------------------------------------------------------------------------
+
+# Runs a ForceLayout off the GUI thread. At most `fps` times per second, and
+# once more at the end, a copy of the positions is handed to `stepped`
+class LayoutThread(QThread):
+
+    stepped = pyqtSignal(object)
+
+    def __init__(self, layout: ForceLayout, iterations=500, fps=30,
+                 parent=None):
+
+        super(type(self), self).__init__(parent)
+
+        self.layout = layout
+        self.iterations = iterations
+        self.interval = 1 / fps
+
+
+    def run(self):
+
+        last = time()
+
+        for _ in range(self.iterations):
+
+            if self.isInterruptionRequested() or self.layout.converged: break
+            self.layout.step()
+
+            if time() - last >= self.interval:
+                self.stepped.emit(self.layout.positions())
+                last = time()
+
+        self.stepped.emit(self.layout.positions())
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# The layout's input for the graph's nodes, in the given order
+def fromGraph(graph: Graph, nodes: list[Node], **kwargs) -> ForceLayout:
+
+    index = {node: i for i, node in enumerate(nodes)}
+
+    edges = [
+        (index[edge.nodes[0]], index[edge.nodes[1]]) for edge in graph.edges
+        if edge.nodes[0] in index and edge.nodes[1] in index
+    ]
+
+    return ForceLayout(
+        graph.store.pos[graph.store.rows(nodes)], edges, **kwargs)
+
+
+# Lays the whole graph out synchronously, for scripts
+def forceLayout(graph: Graph, iterations=500, **kwargs):
+
+    nodes = list(graph.nodes)
+    layout = fromGraph(graph, nodes, **kwargs)
+
+    for _ in range(iterations):
+        if layout.converged: break
+        layout.step()
+
+    graph.placeNodes(nodes, layout.positions())
@@ -4,18 +4,31 @@ Imports
 
 # GUI
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPalette, QColor, QFont, QIcon, QPainter, QPen
-
-from gui import Canvas, EventHandler
+from PyQt5.QtCore import Qt, QLineF, QRectF, QPointF
+from PyQt5.QtGui import (
+    QPalette, QColor, QFont, QIcon, QPainter, QPen, QKeySequence, QMouseEvent
+)
+
+from gui import Canvas, EventHandler, Throttle
+from layout import LayoutThread, fromGraph
+from history import (
+    MoveCommand, OffsetCommand, AddCommand, EditCommand, edgeState, snapshot
+)
 from simulation import SimulationAndPlot, ColorButton
+from binary import saveBinary, loadBinary
+from journal import (
+    Journal, JOURNAL_DIR, journalPath, staleJournals, reclaim, discard
+)
+from compiler import compileGraph
+from analysis import analyze
 
 # Data
 from vector import vec, Vector
 from data import Graph, Node, Edge, Op, Condition
+import grid
 
 # Math
-from numpy import arctan, linalg, sign
+from numpy import arctan, linalg, sign, maximum
 from math import sin, cos, atan2
 
 # Matplot
@@ -32,6 +45,8 @@ Globals
 MOUSE_DIFF = 30
 DATA_INDEX = 3
 
+MODEL_FILTERS = "Graph (*.xml);;Binary model (*.acm)"
+
 # ------------------------------------------------------------------------------
 """
 Program Classes
@@ -57,34 +72,42 @@ class Move(EventHandler):
         t = type(cls.selection)
 
         if t in (Node, Edge):
-            t.unhighlight()
-            cls.selection.setHighlight(True)
-            
+
+            # Grabbing a selected node drags every selected node along
+            if cls.selection not in ctx.canvas.selection:
+                ctx.canvas.selection.set((cls.selection,))
+
+            # Whatever is dragged gets painted on its own, over the rest
             if t is Node:
-                cls.delta = mouse - cls.selection.pos
+                cls.delta = ctx.canvas.toWorld(mouse) - cls.selection.pos
+                ctx.canvas.setDynamic(ctx.canvas.selection.nodes())
+
+            else: ctx.canvas.setDynamic((cls.selection,))
+
+        else: ctx.canvas.selection.clear()
 
 
     @classmethod
     def mouseReleaseEvent(cls, ctx, e):
         cls.selection = None
         cls.delta = None
-        Node.unhighlight()
-        Edge.unhighlight()
+        ctx.canvas.setDynamic(())
+        ctx.canvas.history.seal()
 
 
     @classmethod
     def mouseMoveEvent(cls, ctx, e):
 
         t = type(cls.selection)
-        mouse = ctx.transformCoords(e.x(), e.y())
+        mouse = ctx.canvas.toWorld(ctx.transformCoords(e.x(), e.y()))
 
         if t is Node:
-            cls.selection.pos = mouse + ctx.canvas.cam - cls.delta
+            ctx.canvas.moveSelection(mouse - cls.delta - cls.selection.pos)
 
         elif t is Edge:
 
             # Get vector from the middle point of the edge to the mouse
-            mouse_vec = mouse + ctx.canvas.cam - cls.selection.calculated
+            mouse_vec = mouse - cls.selection.calculated
 
             # Now project that into the actual perpendicular vector of the edge
             perp = cls.selection.perp
@@ -95,8 +118,76 @@ class Move(EventHandler):
             """
 
             # Finally, get the projection's, length
+            before = cls.selection.offset
             cls.selection.offset = linalg.norm(proj) * sign(perp.dot(proj))
 
+            ctx.canvas.history.record(OffsetCommand(
+                cls.selection.id, before, cls.selection.offset
+            ), coalesce=True)
+
+        else: return
+
+        ctx.canvas.schedule('dynamic')
+
+# ------------------------------------
+
+# Clicks select single items, dragging over empty space selects everything the
+# band touches. Shift adds to the selection, Control toggles items in and out
+class Select(EventHandler):
+
+    anchor = None
+    base = set()
+
+    @classmethod
+    def getName(cls): return "Select"
+
+    @classmethod
+    def getIcon(cls):
+        return QIcon.fromTheme('edit-select-all')
+
+    @classmethod
+    def mousePressEvent(cls, ctx, e):
+
+        mouse = ctx.transformCoords(e.x(), e.y())
+        item = ctx.canvas.getAt(mouse)
+        selection = ctx.canvas.selection
+
+        if item is not None:
+
+            if   e.modifiers() & Qt.ControlModifier: selection.toggle((item,))
+            elif e.modifiers() & Qt.ShiftModifier:   selection.add((item,))
+            else:                                    selection.set((item,))
+
+        else:
+
+            cls.anchor = mouse
+            cls.base = set(selection) if e.modifiers() & Qt.ShiftModifier\
+                else set()
+
+            selection.set(cls.base)
+
+
+    @classmethod
+    def mouseReleaseEvent(cls, ctx, e):
+
+        cls.anchor = None
+        cls.base = set()
+        ctx.canvas.setRubberBand(None)
+
+
+    @classmethod
+    def mouseMoveEvent(cls, ctx, e):
+
+        if cls.anchor is None: return
+
+        mouse = ctx.transformCoords(e.x(), e.y())
+
+        ctx.canvas.selection.set(
+            cls.base.union(ctx.canvas.getIn(cls.anchor, mouse)))
+
+        ctx.canvas.setRubberBand(QRectF(QPointF(*cls.anchor), QPointF(*mouse)))
+        ctx.canvas.schedule('dynamic')
+
 # ------------------------------------
 
 class Pan(EventHandler):
@@ -120,25 +211,23 @@ class Pan(EventHandler):
     @classmethod
     def mouseReleaseEvent(cls, ctx, e):
 
-        ctx.canvas.cam = cls.old_cam +\
-            (cls.old_mouse - vec(e.x(), e.y())).astype(int)
-
-        ctx.canvas.cam.apply(lambda i: max(0, i))
+        cls.mouseMoveEvent(ctx, e)
 
         cls.old_mouse = None
         cls.old_cam = None
 
 
+    # The canvas scrolls what it already shows by the motion and only draws
+    # what comes into view, see Canvas.renderScene
     @classmethod
     def mouseMoveEvent(cls, ctx, e):
 
-        ctx.canvas.cam = cls.old_cam +\
-            (cls.old_mouse - vec(e.x(), e.y())).astype(int)
+        ctx.canvas.cam = maximum(
+            cls.old_cam + (cls.old_mouse - vec(e.x(), e.y())) / ctx.canvas.scale,
+            0
+        )
 
-        ctx.canvas.cam.apply(lambda i: max(0, i))
-
-        ctx.canvas.redraw()
-        ctx.update()
+        ctx.canvas.schedule('view')
 
 # ------------------------------------
 
@@ -184,10 +273,10 @@ class AddEdge(EventHandler):
         selection = ctx.canvas.getAt(ctx.transformCoords(e.x(), e.y()))
 
         if type(selection) is Node:
-            ctx.canvas.unhighlight()
-            selection.highlit = True
+            ctx.canvas.selection.set((selection,))
 
             cls.edge[0] = selection
+            ctx.canvas.setDynamic((selection,))
 
 
     @classmethod
@@ -200,7 +289,9 @@ class AddEdge(EventHandler):
                         )
             cls.window.show()
 
-        ctx.canvas.unhighlight()
+        ctx.canvas.selection.clear()
+        ctx.canvas.setRubberBand(None)
+        ctx.canvas.setDynamic(())
         cls.edge[:] = None, None
 
 
@@ -212,27 +303,24 @@ class AddEdge(EventHandler):
             mouse = ctx.transformCoords(e.x(), e.y())
             selection = ctx.canvas.getAt(mouse)
 
-            painter = QPainter(ctx.canvas.pixmap())
-            pen = QPen()
-            pen.setColor(QColor('blue'))
-            pen.setWidth(3)
-            painter.setPen(pen)
+            if type(selection) is not Node: selection = None
 
-            ctx.canvas.unhighlight()
             cls.edge[1] = selection
+            ctx.canvas.selection.set(cls.edge)
+
+            s = ctx.canvas.scale
 
-            x0, y0 = (cls.edge[0].pos - ctx.canvas.cam).astype(int)
-            r0 = cls.edge[0].radius//2
+            x0, y0 = ctx.canvas.toScreen(cls.edge[0].pos).astype(int)
+            r0 = cls.edge[0].radius//2 * s
 
-            if type(selection) is Node:
+            if selection is not None:
 
-                x1, y1 = (selection.pos - ctx.canvas.cam).astype(int)
-                r1 = selection.radius // 2
-                selection.highlit = True
+                x1, y1 = ctx.canvas.toScreen(selection.pos).astype(int)
+                r1 = selection.radius // 2 * s
 
             else:
 
-                x1, y1 = (mouse - ctx.canvas.cam).astype(int)
+                x1, y1 = mouse.astype(int)
                 r1 = r0
 
 
@@ -242,10 +330,10 @@ class AddEdge(EventHandler):
             x1 += round(cos(angle) * r1)
             y1 += round(sin(angle) * r1)
 
-            painter.drawLine(x0 + r0, y0 + r0, x1 + r1, y1 + r1)
-
-            cls.edge[0].highlit = True
-            painter.end()
+            # The source, the target and the band are the only moving parts
+            ctx.canvas.setDynamic((cls.edge[0], selection))
+            ctx.canvas.setRubberBand(QLineF(x0 + r0, y0 + r0, x1 + r1, y1 + r1))
+            ctx.canvas.schedule('dynamic')
 
 # ------------------------------------------------------------------------------
 
@@ -253,11 +341,24 @@ class MainWindow(QMainWindow):
 
     node_editor = None
     edge_editor = None
+    layout_thread = None
+    simulation_window = None
+
+    # Initial condition and simulation settings read along with a binary
+    # model, handed to the simulation window once it's opened
+    model_extras = (None, {})
+
+    # Where edits are autosaved, None to disable it
+    journal_dir = JOURNAL_DIR
+    journal = None
 
     old_mouse = None
     old_cam = None
     button = 0
 
+    # Latest mouse move not handled yet
+    pending_move = None
+
     def __init__(self):
 
         super(type(self), self).__init__()
@@ -269,10 +370,10 @@ class MainWindow(QMainWindow):
         # File Menu ------------------------
 
         save_act = QAction('Save', self)
-        save_act.triggered.connect(self.saveXML)
+        save_act.triggered.connect(self.saveModel)
 
         load_act = QAction('Load', self)
-        load_act.triggered.connect(self.loadXML)
+        load_act.triggered.connect(self.loadModel)
 
         file_menu = menubar.addMenu('File')
         file_menu.addAction(save_act)
@@ -298,6 +399,42 @@ class MainWindow(QMainWindow):
 
             color_menu.addMenu(c)
 
+        # Layout Menu ----------------------
+        layout_act = QAction('Auto Layout', self)
+        layout_act.triggered.connect(self.layoutAction)
+
+        stop_layout_act = QAction('Stop Layout', self)
+        stop_layout_act.triggered.connect(self.stopLayout)
+
+        layout_menu = menubar.addMenu('Layout')
+        layout_menu.addAction(layout_act)
+        layout_menu.addAction(stop_layout_act)
+
+        # Edit Menu ------------------------
+        undo_act = QAction('Undo', self)
+        undo_act.setShortcut(QKeySequence.Undo)
+        undo_act.triggered.connect(lambda: self.canvas.undo())
+
+        redo_act = QAction('Redo', self)
+        redo_act.setShortcut(QKeySequence.Redo)
+        redo_act.triggered.connect(lambda: self.canvas.redo())
+
+        edit_menu = menubar.addMenu('Edit')
+        edit_menu.addAction(undo_act)
+        edit_menu.addAction(redo_act)
+
+        # Analysis Menu --------------------
+        report_act = QAction('Condition Report', self)
+        report_act.triggered.connect(self.reportAction)
+
+        analysis_menu = menubar.addMenu('Analysis')
+        analysis_menu.addAction(report_act)
+
+        states_act = QAction('State Report', self)
+        states_act.triggered.connect(self.statesAction)
+
+        analysis_menu.addAction(states_act)
+
         # Simulation Action ----------------
         run_act = QAction('Simulate', self)
         run_act.triggered.connect(self.runAction)
@@ -305,6 +442,7 @@ class MainWindow(QMainWindow):
         menubar.addAction(run_act)
 
         self.initWidgets()
+        self.initJournal()
 
     # ------------------------------------
 
@@ -331,12 +469,50 @@ class MainWindow(QMainWindow):
         self.canvas = Canvas(main=self, width=800, height=600)
         main_layout.addWidget(self.canvas)
 
+        # Mice may report moves far more often than the screen refreshes.
+        # Only the latest one gets handled, once per frame
+        self.move_throttle = Throttle(
+            self.dispatchMove, self.canvas.frame_interval, self)
+
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
 
         self.canvas.redraw()
         self.update()
 
+    # Journals left behind by sessions that didn't end cleanly are offered
+    # back, newest first, before this one starts its own. Those turned down
+    # are thrown away, those not asked about yet are kept for next time
+    def initJournal(self):
+
+        if self.journal_dir is None: return
+
+        for path in staleJournals(self.journal_dir):
+
+            answer = QMessageBox.question(
+                self, "Recover Model",
+                "A session didn't end cleanly. Recover its unsaved model?")
+
+            if answer != QMessageBox.Yes:
+                discard(path)
+                continue
+
+            graph = reclaim(path)
+            if graph is None: continue
+
+            self.canvas.graph = graph
+            self.canvas.redraw()
+            break
+
+        self.journal = Journal(journalPath(self.journal_dir))
+        self.journal.attach(self.canvas.graph)
+
+
+    def closeEvent(self, e):
+
+        if self.journal is not None: self.journal.close()
+        super(type(self), self).closeEvent(e)
+
     # ------------------------------------
 
     def getSelection(self):
@@ -344,17 +520,19 @@ class MainWindow(QMainWindow):
 
     # ------------------------------------
 
+    # Moves still pending are handled before presses and releases, so these
+    # always see the pointer where it last was
+
     def mousePressEvent(self, e):
 
+        self.move_throttle.flush()
         self.button = e.button()
 
         if e.button() & Qt.LeftButton:
 
             handler = self.getSelection()
             handler.mousePressEvent(self, e)
-            self.canvas.redraw()
-
-            self.update()
+            self.canvas.schedule()
 
         elif e.button() & Qt.MiddleButton:
             Pan.mousePressEvent(self, e)
@@ -362,29 +540,38 @@ class MainWindow(QMainWindow):
 
     def mouseReleaseEvent(self, e):
 
+        self.move_throttle.flush()
         self.button = 0
 
         if e.button() & Qt.LeftButton:
 
             handler = self.getSelection()
             handler.mouseReleaseEvent(self, e)
-            self.canvas.redraw()
-
-            self.update()
+            self.canvas.schedule()
 
         elif e.button() & Qt.MiddleButton:
             Pan.mouseReleaseEvent(self, e)
 
 
+    # Qt reuses its event objects, so the pending one is a copy
     def mouseMoveEvent(self, e):
 
+        if not self.button & (Qt.LeftButton | Qt.MiddleButton): return
+
+        self.pending_move = QMouseEvent(e)
+        self.move_throttle.request()
+
+
+    # Handlers repaint only what they move
+    def dispatchMove(self):
+
+        e, self.pending_move = self.pending_move, None
+        if e is None: return
+
         if self.button & Qt.LeftButton:
-            self.canvas.redraw()
             handler = self.getSelection()
             handler.mouseMoveEvent(self, e)
 
-            self.update()
-
         elif self.button & Qt.MiddleButton:
             Pan.mouseMoveEvent(self, e)
 
@@ -396,6 +583,15 @@ class MainWindow(QMainWindow):
         at = self.canvas.getAt(self.transformCoords(e.x(), e.y()))
         self.launchEditor(at)
 
+
+    def keyPressEvent(self, e):
+
+        if e.key() == Qt.Key_Delete:
+            self.canvas.removeSelection()
+            self.canvas.schedule()
+
+        else: super(type(self), self).keyPressEvent(e)
+
     # ------------------------------------
 
     def launchEditor(self, obj: Union[Node, Edge]):
@@ -414,31 +610,64 @@ class MainWindow(QMainWindow):
     def transformCoords(self, x, y) -> Vector:
 
         rec = self.canvas.geometry()
-        r = vec(0, 0) + Node.radius
+        r = vec(0, 0) + Node.default_radius
 
         return vec(
             x - self.listbox.geometry().width() - MOUSE_DIFF, y - MOUSE_DIFF
         ).clip(r/2, vec(rec.width(), rec.height()) - r)
 
 
-    def saveXML(self):
+    # Binary models also keep the simulation's initial condition and settings
+    def saveModel(self):
 
-        filename = QFileDialog.getSaveFileName(
-            self, "Save Model", ".", "Graph (*.xml)")
+        filename, kind = QFileDialog.getSaveFileName(
+            self, "Save Model", ".", MODEL_FILTERS)
 
-        if filename:
-            self.canvas.graph.saveXML(filename[0])
+        if not filename: return
 
+        if filename.lower().endswith('.acm') or 'acm' in kind:
 
-    def loadXML(self):
+            initial, settings = self.model_extras
 
-        filename = QFileDialog.getOpenFileName(
-            self, "Load Model", ".", "Graph (*.xml)")
+            if self.simulation_window is not None:
+                sim = self.simulation_window.sim
+                initial, settings = sim.canvas.initial, sim.getSettings()
 
-        if filename:
-            self.canvas.graph = Graph.loadXML(filename[0])
-            self.canvas.redraw()
-            self.update()
+            saveBinary(self.canvas.graph, filename, initial, settings)
+
+        else: self.canvas.graph.saveXML(filename)
+
+
+    def loadModel(self):
+
+        filename, kind = QFileDialog.getOpenFileName(
+            self, "Load Model", ".", MODEL_FILTERS)
+
+        if not filename: return
+
+        if filename.lower().endswith('.acm'):
+
+            try: graph, *extras = loadBinary(filename)
+
+            except ValueError as e:
+
+                msg = QMessageBox()
+                msg.setText(f"Could not load model: {e}")
+                msg.exec()
+
+                return
+
+            self.model_extras = tuple(extras)
+
+        else:
+            graph = Graph.loadXML(filename)
+            self.model_extras = (None, {})
+
+        self.canvas.graph = graph
+        if self.journal is not None: self.journal.attach(graph)
+
+        self.canvas.redraw()
+        self.update()
 
     # ------------------------------------
 
@@ -449,6 +678,7 @@ class MainWindow(QMainWindow):
         if len(self.canvas.graph.nodes) > 1:
 
             self.simulation_window = SimulationAndPlot(self.canvas.graph)
+            self.simulation_window.sim.applySettings(*self.model_extras)
             self.simulation_window.show()
 
 
@@ -461,6 +691,96 @@ class MainWindow(QMainWindow):
             msg.exec()
 
 
+    # How much work sharing conditions between edges saves the engine
+    def reportAction(self):
+
+        msg = QMessageBox()
+        msg.setWindowTitle("Condition Report")
+        msg.setText(compileGraph(self.canvas.graph).report())
+        msg.exec()
+
+
+    # Which states are frozen, stuck in or out of reach. Reachability takes
+    # the loaded initial condition into account, if there's one
+    def statesAction(self):
+
+        graph = self.canvas.graph
+
+        # The grid being edited in the simulation window, once there is one,
+        # otherwise the one loaded with the model
+        if self.simulation_window is not None:
+            initial = self.simulation_window.sim.canvas.initial
+
+        else: initial = self.model_extras[0]
+
+        # The graph may have lost states since the grid was made
+        if initial is not None:
+
+            try: grid.checkGrid(initial, len(graph.nodes))
+            except ValueError: initial = None
+
+        analysis = analyze(compileGraph(graph), initial)
+
+        msg = QMessageBox()
+        msg.setWindowTitle("State Report")
+        msg.setText(analysis.report())
+        msg.exec()
+
+    # ------------------------------------
+
+    # The layout runs on its own thread and streams positions back, which are
+    # applied here, on the GUI thread, as they arrive
+    def layoutAction(self):
+
+        if self.layout_thread is not None: return
+
+        graph = self.canvas.graph
+        if len(graph.nodes) < 2: return
+
+        self.layout_graph = graph
+        self.layout_nodes = list(graph.nodes)
+
+        self.layout_thread = LayoutThread(
+            fromGraph(graph, self.layout_nodes), parent=self)
+
+        self.layout_thread.stepped.connect(self.layoutStepped)
+        self.layout_thread.finished.connect(self.layoutFinished)
+        self.layout_thread.start()
+
+
+    def layoutStepped(self, positions):
+
+        graph = self.canvas.graph
+
+        # A different model was loaded meanwhile
+        if graph is not self.layout_graph: return self.stopLayout()
+
+        # Nodes deleted meanwhile are left out
+        alive = [
+            i for i, node in enumerate(self.layout_nodes)
+            if node.graph is graph
+        ]
+
+        nodes = [self.layout_nodes[i] for i in alive]
+        delta = positions[alive] - graph.store.pos[graph.store.rows(nodes)]
+
+        graph.placeNodes(nodes, positions[alive])
+        self.canvas.history.record(
+            MoveCommand([node.id for node in nodes], delta), coalesce=True)
+
+        self.canvas.schedule()
+
+
+    def stopLayout(self):
+        if self.layout_thread is not None:
+            self.layout_thread.requestInterruption()
+
+
+    def layoutFinished(self):
+        self.layout_thread = self.layout_graph = self.layout_nodes = None
+        self.canvas.history.seal()
+
+
     def colorizeAction(self, cmname):
 
         def inner():
@@ -469,9 +789,14 @@ class MainWindow(QMainWindow):
 
             cm = get_cmap(cmname)
             rate = 1 / len(self.canvas.graph.nodes)
+            before = snapshot(self.canvas.graph.nodes)
 
             for i, node in enumerate(self.canvas.graph.nodes):
                 node.color = QColor(*cm(rate*i, bytes=True, alpha=255)).name()
+                node.notify('edit')
+
+            self.canvas.history.record(
+                EditCommand(before, snapshot(self.canvas.graph.nodes)))
 
             self.canvas.redraw()
             self.update()
@@ -583,17 +908,25 @@ class EditNodeWindow(QWidget):
 
     def okBtn(self):
 
+        # The edges' priorities may change along with the node
+        before = snapshot((self.target, *self.target.outgoing))
+
         self.target.name = self.namebox.text()
         self.target.color = self.colorbox.color
 
-        self.ctx.canvas.redraw()
-        self.ctx.update()
-
         for ind, i in enumerate(range(self.list.count())):
             e = self.list.item(i).data(DATA_INDEX)
             e.priority = ind
 
         self.target.outgoing.sort(key=Node.edgeReorder)
+        self.target.notify('edit')
+        for edge in self.target.outgoing: edge.notify('edit')
+
+        self.ctx.canvas.history.record(EditCommand(
+            before, snapshot((self.target, *self.target.outgoing))))
+
+        self.ctx.canvas.redraw()
+        self.ctx.update()
 
         self.close()
 
@@ -623,10 +956,8 @@ class ConditionOp(QWidget):
 
         if state is not None:
 
-            for ind, node in enumerate(ctx.canvas.graph.nodes):
-                if node.id == state: break
-
-            self._state.setCurrentIndex(ind)
+            ind = self._state.findData(state)
+            if ind >= 0: self._state.setCurrentIndex(ind)
 
 
         lay.addWidget(self._state)
@@ -821,6 +1152,8 @@ class EditEdgeWindow(QWidget):
 
     def okBtn(self):
 
+        before = snapshot((self.target,)) if self.target.registered else None
+
         self.target.name = self.namebox.text()
         self.target.probability = self.probbox.value()
         self.target.conditions.clear()
@@ -834,8 +1167,15 @@ class EditEdgeWindow(QWidget):
 
         if not self.target.registered: self.target.register()
 
+        history = self.ctx.canvas.history
+
         if not self.target in self.ctx.canvas.graph.edges:
             self.ctx.canvas.graph.addEdge(self.target)
+            history.record(AddCommand((), (edgeState(self.target),)))
+
+        else:
+            self.target.notify('edit')
+            history.record(EditCommand(before, snapshot((self.target,))))
 
         self.ctx.canvas.redraw()
         self.ctx.update()
@@ -0,0 +1,266 @@
+"""
+Imports
+"""
+
+# Data
+from data import Graph
+from compiler import Program, OPERATORS, compileGraph
+
+# Math
+from numpy import (
+    array, asarray, zeros, ones, empty, cumprod, cumsum, bincount, clip, arange,
+    append, exp, log
+)
+from math import factorial, comb
+
+# ------------------------------------------------------------------------------
+"""
+Globals
+"""
+
+NEIGHBORHOOD = 8
+
+FACTORIALS = array([factorial(n) for n in range(NEIGHBORHOOD + 1)])
+
+# Every value a neighbor count can take, and how many ways it can be reached
+COUNTS = arange(NEIGHBORHOOD + 1)
+BINOMIALS = array([comb(NEIGHBORHOOD, k) for k in COUNTS])
+
+# Above this many neighborhoods, conditions are taken as independent instead
+# of enumerating them all, which grows exponentially with the states counted
+MAX_NEIGHBORHOODS = 5000
+
+# Stands in for 0 under logarithms
+TINY = 1e-300
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+
+A cheap estimate of how a model's populations evolve, on an endless grid where
+every cell's neighbors are drawn independently from the current fractions of
+each state (mean-field). How many of the 8 neighbors are in each counted state
+is then multinomial. When few states are counted, every possible
+neighborhood, as counts per plane plus the rest, is enumerated once up front:
+
+    weights         how likely each neighborhood is, given the fractions
+    fires[k]        per neighborhood, how likely edge k is to be the one that
+                    fires: its condition holds, it's drawn, and no earlier
+                    edge of its state fired
+
+A step then costs one product over the neighborhoods, however large the grid.
+With more states counted, the neighborhoods grow too many, and each count is
+taken on its own instead, binomial with its state's fraction. A condition's
+comparisons on the same state are still judged together, but the counts of
+different states are taken as independent, as are the conditions of a
+state's edges, which slightly misjudges conditions that share counts.
+
+Correlations between neighbors (clusters, fronts) are ignored either way, so
+spatial models drift from it over time
+"""
+
+class MeanField:
+
+    def __init__(self, program: Program):
+
+        self.program = program
+
+        # Only states that exist are counted, the rest always count 0
+        planes = [state for state in program.planes if state >= 0]
+
+        self.exact = comb(
+            NEIGHBORHOOD + len(planes), len(planes)) <= MAX_NEIGHBORHOODS
+
+        # Every edge as (source, target), in the order they're tried
+        edges = [
+            (state, target)
+            for state, rule in enumerate(program.rules)
+            for _, _, target in rule
+        ]
+
+        self.sources = array([s for s, _ in edges], dtype=int)
+        self.targets = array([t for _, t in edges], dtype=int)
+
+        if self.exact: self.enumerateNeighborhoods(planes)
+
+        else:
+
+            # The state each comparison counts, -1 being a state always
+            # at a fraction of 0
+            compared = [
+                program.planes[plane] for plane, _, _ in program.comparisons]
+
+            truth = [
+                OPERATORS[op](COUNTS, amount)
+                for _, op, amount in program.comparisons
+            ]
+
+            # A disjunction's comparisons on the same state are or'ed into
+            # one, since they all read the same count
+            groups = {}
+
+            for i, terms in enumerate(program.disjunctions):
+                for t in terms:
+                    key = (i, compared[t])
+                    groups[key] = groups.get(key, False) | truth[t]
+
+            self.compared = array([state for _, state in groups], dtype=int)
+            self.truth = array(list(groups.values())).reshape(-1, len(COUNTS))
+
+            # Which groups each disjunction ors together
+            self.members = zeros((len(program.disjunctions), len(groups)))
+
+            for g, (i, _) in enumerate(groups): self.members[i, g] = 1
+
+            # Per edge, its condition, past the last one if it has none, its
+            # probability and where its state's edges start
+            rules = program.rules
+            starts = cumsum([0] + [len(rule) for rule in rules])
+
+            self.conditions = array([
+                len(program.disjunctions) if d is None else d
+                for rule in rules for d, _, _ in rule
+            ], dtype=int)
+
+            self.probabilities = array(
+                [p for rule in rules for _, p, _ in rule]) / 100
+
+            self.starts = array([
+                start for rule, start in zip(rules, starts) for _ in rule
+            ], dtype=int)
+
+
+    def enumerateNeighborhoods(self, planes):
+
+        program = self.program
+        column = {state: i for i, state in enumerate(planes)}
+
+        self.planes = array(planes, dtype=int)
+        self.counts = array(
+            list(compositions(NEIGHBORHOOD, len(planes) + 1)), dtype=int)
+
+        # Multinomial coefficients, the orderings of each neighborhood
+        self.coefficients = (
+            FACTORIALS[NEIGHBORHOOD] / FACTORIALS[self.counts].prod(axis=1))
+
+        comparisons = [
+            OPERATORS[op](
+                self.counts[:, column[program.planes[plane]]]
+                if program.planes[plane] >= 0 else zeros(len(self.counts)),
+                amount
+            )
+            for plane, op, amount in program.comparisons
+        ]
+
+        conditions = [
+            array([comparisons[t] for t in terms]).any(axis=0)
+            for terms in program.disjunctions
+        ]
+
+        fires = []
+
+        for rule in program.rules:
+
+            if not rule: continue
+
+            chances = array([
+                (ones(len(self.counts)) if d is None else conditions[d])
+                * probability / 100
+                for d, probability, _ in rule
+            ])
+
+            # Edges are tried in order, so each only gets the cells that the
+            # ones before it let through
+            through = cumprod(1 - chances, axis=0)
+            chances[1:] *= through[:-1]
+
+            fires.extend(chances)
+
+        self.fires = (
+            array(fires).T if fires else zeros((len(self.counts), 0)))
+
+    # ------------------------------------
+
+    # How likely each neighborhood is, given the fractions of each state
+    def weights(self, fractions):
+
+        p = fractions[self.planes]
+        p = clip(list(p) + [1 - p.sum()], 0, 1)
+
+        return self.coefficients * (p ** self.counts).prod(axis=1)
+
+
+    # How likely a cell is to take each edge, given the fractions
+    def chances(self, fractions):
+
+        if self.exact: return self.weights(fractions) @ self.fires
+
+        # Binomial odds of each count, for each group's state
+        p = clip(append(fractions, 0)[self.compared], 0, 1).reshape(-1, 1)
+        odds = BINOMIALS * p ** COUNTS * (1 - p) ** (NEIGHBORHOOD - COUNTS)
+
+        held = (odds * self.truth).sum(axis=1)
+
+        # Products of the odds of failing, as sums of logs
+        missed = log(clip(1 - held, TINY, 1))
+        conditions = append(1 - exp(self.members @ missed), 1)
+
+        chances = conditions[self.conditions] * self.probabilities
+
+        # Each edge only gets the cells its state's earlier edges let through
+        missed = log(clip(1 - chances, TINY, 1))
+        before = cumsum(missed) - missed
+
+        return chances * exp(before - before[self.starts])
+
+
+    def step(self, fractions):
+
+        flow = fractions[self.sources] * self.chances(fractions)
+
+        new = fractions.copy()
+        new -= bincount(self.sources, flow, minlength=len(fractions))
+        new += bincount(self.targets, flow, minlength=len(fractions))
+
+        return new
+
+
+    # The fractions of each state, at first and after each step, shaped
+    # (steps + 1, states)
+    def run(self, fractions, steps: int):
+
+        series = empty((steps + 1, self.program.states))
+        series[0] = asarray(fractions, dtype=float) / sum(fractions)
+
+        for i in range(steps): series[i + 1] = self.step(series[i])
+
+        return series
+
+# ------------------------------------------------------------------------------
+"""
+Auxiliary functions
+"""
+
+# Every way of splitting `total` into `parts` counts, in lexicographic order
+def compositions(total: int, parts: int):
+
+    if parts == 1:
+        yield (total,)
+        return
+
+    for first in range(total + 1):
+        for rest in compositions(total - first, parts - 1):
+            yield (first, *rest)
+
+
+# The predicted fractions of each state of `graph`, starting from `initial`,
+# a grid of states or the fractions themselves
+def predict(graph: Graph, initial, steps: int, fractions=False):
+
+    program = compileGraph(graph)
+
+    if not fractions:
+        initial = bincount(
+            asarray(initial).ravel(), minlength=program.states)
+
+    return MeanField(program).run(initial, steps)
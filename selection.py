@@ -0,0 +1,97 @@
+"""
+Imports
+"""
+
+# Data
+from data import Node, Edge
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# The set of selected nodes and edges. Every change hands the items whose
+# state flipped to the listeners, so only those need to be drawn again
+class Selection:
+
+    def __init__(self):
+
+        self.items = set()
+
+        # Callables taking the set of items that were (de)selected
+        self.listeners = []
+
+    # ------------------------------------
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, changed: set):
+        if changed:
+            for listener in self.listeners: listener(changed)
+
+    # ------------------------------------
+
+    def _apply(self, added: set, removed: set):
+
+        for item in removed: item.highlit = False
+        for item in added: item.highlit = True
+
+        self.items -= removed
+        self.items |= added
+
+        self.notify(added | removed)
+
+
+    def set(self, items):
+
+        items = set(items)
+        items.discard(None)
+
+        self._apply(items - self.items, self.items - items)
+
+
+    def add(self, items):
+
+        items = set(items)
+        items.discard(None)
+
+        self._apply(items - self.items, set())
+
+
+    def discard(self, items):
+        self._apply(set(), self.items & set(items))
+
+
+    def toggle(self, items):
+
+        items = set(items)
+        items.discard(None)
+
+        self._apply(items - self.items, items & self.items)
+
+
+    def clear(self):
+        self._apply(set(), set(self.items))
+
+    # ------------------------------------
+
+    def nodes(self) -> list[Node]:
+        return [item for item in self.items if type(item) is Node]
+
+    def edges(self) -> list[Edge]:
+        return [item for item in self.items if type(item) is Edge]
+
+    # ------------------------------------
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
@@ -5,24 +5,30 @@ Imports
 # GUI
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QtCore import QRect, QRectF, Qt
+from PyQt5.QtCore import QRect, QRectF, QLineF, Qt, QTimer
 
 # Data
 from data import Graph, Node, Edge, Condition
+from codeGenerator import slugify
+from compiler import compileGraph
+from engine import Engine
+from meanfield import MeanField
+import grid
 
 # Math
-from math import floor
-from random import choices, random
+from math import floor, hypot, isqrt
+from numpy import asarray
+from random import random # Used by the generated rules in PlotWindow
 
 # Plotting
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 from collections import Counter
+from itertools import chain
 
-# Sanitizing strings
-import unicodedata
-import re
+# Files
+import os
 
 try:
     from ca import *
@@ -38,6 +44,8 @@ except (ImportError, ModuleNotFoundError):
 Auxiliary Functions
 """
 
+INITIAL_FILTERS = "Image (*.png);;NumPy array (*.npy)"
+
 MAXIMUM_STRING_LENGTH = 8
 def formattedLabel(text: str) -> QLabel:
 
@@ -49,25 +57,6 @@ def formattedLabel(text: str) -> QLabel:
     return QLabel(s)
 
 
-def slugify(value, allow_unicode=False):
-    """
-    Taken from https://github.com/django/django/blob/master/django/utils/text.py
-    Convert to ASCII if 'allow_unicode' is False. Convert spaces or repeated
-    dashes to single dashes. Remove characters that aren't alphanumerics,
-    underscores, or hyphens. Convert to lowercase. Also strip leading and
-    trailing whitespace, dashes, and underscores.
-    """
-    value = str(value)
-    if allow_unicode:
-        value = unicodedata.normalize('NFKC', value)
-
-    else:
-        value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').\
-            decode('ascii')
-
-    value = re.sub(r'[^\w\s-]', '', value.lower())
-    return re.sub(r'[-\s]+', '-', value).strip('-_').replace('-', '_')
-
 # ------------------------------------------------------------------------------
 """
 Auxiliary Classes
@@ -107,6 +96,9 @@ Program Classes
 
 class SimulationFrame(QLabel):
 
+    # Cells smaller than this many pixels are drawn without a grid
+    grid_line_threshold = 4
+
     def __init__(self, graph, width=600, height=600, dimension=30, *args, **kwargs):
 
         super().__init__(*args, **kwargs)
@@ -121,12 +113,12 @@ class SimulationFrame(QLabel):
 
         # TODO:
         # - NxM rather than NxN
-        # - Initial condition based on randomness
         self._dimension = dimension
-        self.initial = [
-            [0] * self._dimension
-            for _ in range(self._dimension)
-        ]
+        self.initial = grid.emptyGrid(
+            self._dimension, self._dimension, len(self.graph.nodes))
+
+        self.pw = width / self._dimension
+        self.ph = height / self._dimension
 
 
     def redraw(self):
@@ -135,25 +127,25 @@ class SimulationFrame(QLabel):
 
         self.pixmap().fill(QColor('white'))
         painter = QPainter(self.pixmap())
-        painter.setRenderHints(QPainter.Antialiasing|QPainter.TextAntialiasing)
 
-        painter.setPen(Qt.darkGray)
         self.pw = w / self._dimension
         self.ph = h / self._dimension
 
-        for y in range(self._dimension):
-            for x in range(self._dimension):
+        # The whole grid is a single image, scaled without smoothing
+        image, buffer = grid.toImage(
+            self.initial, [node.color for node in self.graph.nodes])
+        painter.drawImage(QRectF(0, 0, w, h), image)
 
-                _x = x*self.pw
-                _y = y*self.ph
+        if min(self.pw, self.ph) >= self.grid_line_threshold:
 
-                rect = QRectF(_x, _y, _x + self.pw, _y + self.ph)
-                el = self.initial[x][y]
+            painter.setPen(Qt.darkGray)
 
-                painter.setBrush(QColor(self.graph.nodes[el].color))
-                painter.drawRect(rect)
+            for i in range(self._dimension + 1):
+                painter.drawLine(QLineF(i*self.pw, 0, i*self.pw, h))
+                painter.drawLine(QLineF(0, i*self.ph, w, i*self.ph))
 
         painter.end()
+        self.parent().update()
 
 
     def resizeEvent(self, e):
@@ -164,42 +156,68 @@ class SimulationFrame(QLabel):
         self.setPixmap(canvas)
 
         self.redraw()
-        self.parent().update()
-
 
-    def randomize(self, weights):
 
-        c = list(range(len(self.graph.nodes)))
+    def randomize(self, weights, seed=None):
 
-        self.initial = [
-            choices(c, weights, k=self._dimension)
-            for _ in range(self._dimension)
-        ]
+        self.initial = grid.randomGrid(
+            self._dimension, self._dimension, weights, seed)
 
         self.redraw()
-        self.parent().update()
 
 
-    def updateCell(self, point, ind: int):
+    def cellAt(self, point):
 
         p = self.mapFromParent(point)
         x, y = p.x(), p.y()
 
-        if x >= 0 and x <= self.width() and y >= 0 and y <= self.height():
-            i, j = floor(x / self.pw), floor(y / self.ph)
+        if x >= 0 and x < self.width() and y >= 0 and y < self.height():
+            return (
+                min(floor(x / self.pw), self._dimension - 1),
+                min(floor(y / self.ph), self._dimension - 1)
+            )
+
+        return None
 
-            self.initial[i][j] = ind
 
+    def updateCell(self, point, ind: int):
+
+        cell = self.cellAt(point)
+
+        if cell is not None:
+            self.initial[cell] = ind
+            self.redraw()
+
+
+    def apply(self, tool, *args):
+
+        # Each region tool is a single NumPy operation on the grid
+        if tool(self.initial, *args) is not None:
             self.redraw()
-            self.parent().update()
+
+
+    def setInitial(self, initial):
+
+        # TODO: NxM rather than NxN
+        if initial.shape[0] != initial.shape[1]:
+            raise ValueError(
+                f"Initial conditions must be square, not {initial.shape}")
+
+        self._dimension = initial.shape[0]
+        self.initial = initial
+        self.redraw()
 
 
     def getDimension(self):
         return self._dimension
 
     def setDimention(self, dimension):
+
         self._dimension = dimension
-        # TODO: Redraw here
+        self.initial = grid.emptyGrid(
+            self._dimension, self._dimension, len(self.graph.nodes))
+
+        self.redraw()
 
     dimension = property(getDimension, setDimention)
 
@@ -207,6 +225,9 @@ class SimulationFrame(QLabel):
 
 class SimulationDistribution(QWidget):
 
+    # Milliseconds of slider silence before the grid is regenerated
+    debounce = 150
+
     def __init__(self, names_colors, _parent):
 
         super(type(self), self).__init__()
@@ -218,6 +239,12 @@ class SimulationDistribution(QWidget):
         self.old_check = None
         self._parent = _parent
 
+        # Dragging a slider fires many changes, only the last one matters
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.debounce)
+        self.timer.timeout.connect(self._parent.randomize)
+
         # --------------------------------------
 
         self.initWidgets()
@@ -271,7 +298,7 @@ class SimulationDistribution(QWidget):
             for _, lab in self.sliders:
                 lab.setText("0.0%")
 
-        self._parent.randomize()
+        self.timer.start()
 
 
     def updateButtons(self, ind):
@@ -300,18 +327,23 @@ class SimulationDistribution(QWidget):
     def getWeights(self):
 
         total = sum(sl.value() for sl, _ in self.sliders)
+
+        if total == 0: return [1 / len(self.sliders)] * len(self.sliders)
         return [sl.value() / total for sl, _ in self.sliders]
 
 # ------------------------------------------------------------------------------
 
 class SimulationWindow(QWidget):
 
+    tools = ('Pencil', 'Line', 'Rectangle', 'Circle', 'Fill', 'Stamp')
+
     def __init__(self, graph: Graph, parent=None):
 
         super(type(self), self).__init__(parent)
         self.graph = graph
 
         self.button = 0
+        self.anchor = self.last = None
         self.setMouseTracking(True)
 
         self.initWidgets()
@@ -340,6 +372,38 @@ class SimulationWindow(QWidget):
         btn.clicked.connect(self.randomize)
         lay.addWidget(btn)
 
+        # Region tools ---------------------
+        form = QFormLayout()
+        tools = QWidget()
+
+        self.toolbox = QComboBox()
+        self.toolbox.addItems(self.tools)
+        self.toolbox.currentTextChanged.connect(
+            lambda t: self.stampbox.setEnabled(t == 'Stamp'))
+        form.addRow("Tool:", self.toolbox)
+
+        self.stampbox = QComboBox()
+        self.stampbox.addItems(grid.STAMPS.keys())
+        self.stampbox.setEnabled(False)
+        form.addRow("Stamp:", self.stampbox)
+
+        self.dimensionbox = QSpinBox()
+        self.dimensionbox.setRange(2, 4000)
+        self.dimensionbox.setValue(30)
+        self.dimensionbox.setKeyboardTracking(False)
+        self.dimensionbox.valueChanged.connect(self.setDimension)
+        form.addRow("Dimension:", self.dimensionbox)
+
+        # An empty seed draws a different grid every time
+        self.seedbox = QLineEdit()
+        self.seedbox.setValidator(QIntValidator(0, 2**31 - 1))
+        self.seedbox.setPlaceholderText("Random")
+        self.seedbox.editingFinished.connect(self.randomize)
+        form.addRow("Seed:", self.seedbox)
+
+        tools.setLayout(form)
+        lay.addWidget(tools)
+
         wid.setLayout(lay)
         main_layout.addWidget(wid)
 
@@ -357,10 +421,19 @@ class SimulationWindow(QWidget):
         sim_act = QAction('Simulate in Place', self)
         sim_act.triggered.connect(self.simulate)
 
+        import_act = QAction('Import Initial Condition', self)
+        import_act.triggered.connect(self.importInitial)
+
+        export_act = QAction('Export Initial Condition', self)
+        export_act.triggered.connect(self.exportInitial)
+
         file_menu = menubar.addMenu('File')
 
         file_menu.addAction(code_act)
         file_menu.addAction(sim_act )
+        file_menu.addSeparator()
+        file_menu.addAction(import_act)
+        file_menu.addAction(export_act)
 
         self.layout().setMenuBar(menubar)
 
@@ -369,23 +442,108 @@ class SimulationWindow(QWidget):
     # ------------------------------------
 
     def randomize(self):
-        self.canvas.randomize(self.dist.getWeights())
+
+        # The timer may still be pending from a slider, this supersedes it
+        self.dist.timer.stop()
+
+        seed = self.seedbox.text()
+        self.canvas.randomize(
+            self.dist.getWeights(), int(seed) if seed else None)
+
+
+    def setDimension(self, dimension):
+        self.canvas.dimension = dimension
+        self.randomize()
+
+    # ------------------------------------
+    # What binary model files keep besides the graph, see binary.py
+
+    def getSettings(self) -> dict:
+        return {'dimension': self.canvas.dimension, 'seed': self.seedbox.text()}
+
+
+    # A stored grid only applies if it still fits the graph's states
+    def applySettings(self, initial, settings: dict):
+
+        self.seedbox.setText(settings.get('seed', ''))
+
+        if initial is not None:
+
+            try:
+                self.canvas.setInitial(
+                    grid.checkGrid(initial, len(self.graph.nodes)))
+
+            except ValueError: initial = None
+
+        if initial is None and 'dimension' in settings:
+            self.canvas.dimension = settings['dimension']
+
+        self.dimensionbox.blockSignals(True)
+        self.dimensionbox.setValue(self.canvas.dimension)
+        self.dimensionbox.blockSignals(False)
 
     # ------------------------------------
+    # Press/release pairs delimit the shape tools, while the pencil paints a
+    # line from the last sampled cell so fast strokes don't leave gaps
 
     def mousePressEvent(self, e):
+
         self.button = e.button()
-        self.mouseMoveEvent(e)
+        self.anchor = self.last = self.canvas.cellAt(e.pos())
+
+        state = self.dist.old_check
+        if self.anchor is None or state is None: return
+
+        tool = self.toolbox.currentText()
+
+        if tool == 'Pencil':
+            self.canvas.apply(grid.drawLine, self.anchor, self.anchor, state)
+
+        elif tool == 'Fill':
+            self.canvas.apply(grid.floodFill, self.anchor, state)
+
+        elif tool == 'Stamp':
+            pattern = grid.STAMPS[self.stampbox.currentText()]
+            self.canvas.apply(grid.stamp, pattern, self.anchor, state)
 
 
     def mouseMoveEvent(self, e):
 
-        if self.button and self.dist.old_check is not None:
-            self.canvas.updateCell(e.pos(), self.dist.old_check)
+        state = self.dist.old_check
+
+        if not self.button or state is None: return
+        if self.toolbox.currentText() != 'Pencil': return
+
+        cell = self.canvas.cellAt(e.pos())
+
+        if cell is not None and self.last is not None:
+            self.canvas.apply(grid.drawLine, self.last, cell, state)
+
+        self.last = cell
 
 
     def mouseReleaseEvent(self, e):
+
+        cell = self.canvas.cellAt(e.pos())
+        state = self.dist.old_check
+        tool = self.toolbox.currentText()
+
+        if None not in (self.anchor, cell, state):
+
+            if tool == 'Line':
+                self.canvas.apply(grid.drawLine, self.anchor, cell, state)
+
+            elif tool == 'Rectangle':
+                self.canvas.apply(grid.fillRect, self.anchor, cell, state)
+
+            elif tool == 'Circle':
+                radius = round(hypot(
+                    cell[0] - self.anchor[0], cell[1] - self.anchor[1]))
+
+                self.canvas.apply(grid.fillCircle, self.anchor, radius, state)
+
         self.button = 0
+        self.anchor = self.last = None
 
     # ------------------------------------
 
@@ -399,12 +557,65 @@ class SimulationWindow(QWidget):
             modelname = filename[0].split('/')[-1]
             modelname = slugify('_'.join(modelname.split('.')[:-1]))
 
-            l = []
-            for _l in self.canvas.initial:
-                l.extend(_l)
+            # The grid goes into a side file next to the script
+            condfile = f"{modelname}.npy"
+            grid.saveArray(
+                self.canvas.initial,
+                os.path.join(os.path.dirname(filename[0]), condfile)
+            )
 
             with open(filename[0], "w") as f:
-                f.write(self.graph.generateCode(name=modelname, cond=l))
+                self.graph.writeCode(
+                    f, name=modelname, condfile=condfile,
+                    dimension=self.canvas.dimension
+                )
+
+
+    def importInitial(self):
+
+        filename, kind = QFileDialog.getOpenFileName(
+            self, "Import Initial Condition", ".", INITIAL_FILTERS)
+
+        if not filename: return
+
+        colors = [node.color for node in self.graph.nodes]
+
+        try:
+            if filename.lower().endswith('.npy'):
+                initial = grid.loadArray(filename, len(colors))
+
+            else: initial = grid.loadImage(filename, colors)
+
+            self.canvas.setInitial(initial)
+
+        except ValueError as e:
+
+            msg = QMessageBox()
+            msg.setText(f"Could not import initial condition: {e}")
+            msg.exec()
+
+            return
+
+        self.dimensionbox.blockSignals(True)
+        self.dimensionbox.setValue(self.canvas.dimension)
+        self.dimensionbox.blockSignals(False)
+
+
+    def exportInitial(self):
+
+        filename, kind = QFileDialog.getSaveFileName(
+            self, "Export Initial Condition", ".", INITIAL_FILTERS)
+
+        if not filename: return
+
+        if filename.lower().endswith('.npy') or 'npy' in kind:
+            grid.saveArray(self.canvas.initial, filename)
+
+        else:
+            grid.saveImage(
+                self.canvas.initial,
+                [node.color for node in self.graph.nodes], filename
+            )
 
     def simulate(self):
         self.parent().setCurrentIndex(1)
@@ -505,15 +716,20 @@ class PlotWindow(QWidget):
 
         exec(self.graph._codeClass('_TMPCAClass'), globals(), globals())
 
+        values = self.initialFunc()
+
         _TMPCAInst = _TMPCAClass(
-            30, random_values=False, values=self.initialFunc(),
+            isqrt(len(values)), random_values=False, values=values,
             max=len(self.graph.nodes)-1
         )
 
-        self._gen = plotPart(
-            _TMPCAInst, N=50,
-            colors=[node.color for node in self.graph.nodes],
-            names=[node.name for node in self.graph.nodes]
+        self._gen = chain(
+            [predictionFigure(self.graph, values, N=50)],
+            plotPart(
+                _TMPCAInst, N=50,
+                colors=[node.color for node in self.graph.nodes],
+                names=[node.name for node in self.graph.nodes]
+            )
         )
 
         self.stack.addWidget(FigureCanvas(next(self._gen)))
@@ -566,6 +782,34 @@ class PlotWindow(QWidget):
 
 # ------------------------------------------------------------------------------
 
+# The share of cells in each state over `N` steps, as simulated by the engine
+# (solid) and as the mean-field approximation predicts (dashed). The
+# prediction is nearly free, so parameters can be screened with it first
+def predictionFigure(graph: Graph, values, N=50):
+
+    program = compileGraph(graph)
+
+    initial = asarray(values)
+    initial = initial.reshape(isqrt(len(initial)), -1)
+
+    simulated = Engine(program, initial).run(N) / initial.size
+    predicted = MeanField(program).run(simulated[0], N)
+
+    fig, ax = plt.subplots()
+
+    for i, (name, color) in enumerate(zip(program.names, program.colors)):
+        ax.plot(simulated[:, i], color=color, label=name)
+        ax.plot(predicted[:, i], color=color, linestyle='--')
+
+    ax.set_title("Simulated (solid) and mean-field (dashed)")
+    ax.set_xlabel("Step")
+    ax.set_ylabel("Share of cells")
+    ax.legend()
+
+    return fig
+
+# ------------------------------------------------------------------------------
+
 class SimulationAndPlot(QStackedWidget):
 
     def __init__(self, graph: Graph):
@@ -578,12 +822,7 @@ class SimulationAndPlot(QStackedWidget):
 
 
     def getInitial(self):
-        l = []
-
-        for _l in self.sim.canvas.initial:
-            l.extend(_l)
-
-        return l[::-1]
+        return self.sim.canvas.initial.ravel()[::-1].tolist()
 
 
     def closeEvent(self, e):
@@ -0,0 +1,158 @@
+"""
+Imports
+"""
+
+# Data
+from collections import defaultdict
+from math import floor
+
+# ------------------------------------------------------------------------------
+"""
+Class definition
+"""
+
+# Uniform grid hash over axis-aligned boxes. Every item is registered in each
+# cell its box overlaps, so a point query only looks at the items of one cell
+class GridIndex:
+
+    def __init__(self, cell=128):
+
+        self.cell = cell
+        self.cells = defaultdict(set)
+
+        self.boxes = {} # item -> (x0, y0, x1, y1)
+        self.ranges = {} # item -> (i0, j0, i1, j1), the cells it occupies
+
+        # Insertion order, so queries can honor the order items were added in
+        self.order = {}
+        self.counter = 0
+
+    # ------------------------------------
+
+    def _range(self, box):
+
+        x0, y0, x1, y1 = box
+        c = self.cell
+
+        return floor(x0 / c), floor(y0 / c), floor(x1 / c), floor(y1 / c)
+
+
+    def _cells(self, r):
+
+        i0, j0, i1, j1 = r
+
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield i, j
+
+    # ------------------------------------
+
+    def insert(self, item, box):
+
+        if item in self.boxes:
+            return self.update(item, box)
+
+        r = self._range(box)
+        for c in self._cells(r): self.cells[c].add(item)
+
+        self.boxes[item] = box
+        self.ranges[item] = r
+
+        self.order[item] = self.counter
+        self.counter += 1
+
+
+    def remove(self, item):
+
+        if item not in self.boxes: return
+
+        for c in self._cells(self.ranges.pop(item)):
+
+            bucket = self.cells[c]
+            bucket.discard(item)
+
+            if not bucket: del self.cells[c]
+
+        del self.boxes[item]
+        del self.order[item]
+
+
+    # Moving within the same cells only replaces the box
+    def update(self, item, box):
+
+        if item not in self.boxes:
+            return self.insert(item, box)
+
+        r = self._range(box)
+        old = self.ranges[item]
+
+        if r != old:
+
+            for c in self._cells(old):
+
+                bucket = self.cells[c]
+                bucket.discard(item)
+
+                if not bucket: del self.cells[c]
+
+            for c in self._cells(r): self.cells[c].add(item)
+            self.ranges[item] = r
+
+        self.boxes[item] = box
+
+
+    def clear(self):
+
+        self.cells.clear()
+        self.boxes.clear()
+        self.ranges.clear()
+        self.order.clear()
+
+    # ------------------------------------
+
+    # Items whose box strictly contains (x, y), in insertion order
+    def query(self, x, y):
+
+        c = self.cell
+        bucket = self.cells.get((floor(x / c), floor(y / c)), ())
+
+        found = [
+            item for item in bucket
+            if  self.boxes[item][0] < x < self.boxes[item][2]
+            and self.boxes[item][1] < y < self.boxes[item][3]
+        ]
+
+        return sorted(found, key=self.order.__getitem__)
+
+
+    # Items whose box overlaps the given one, in insertion order
+    def queryRect(self, box):
+
+        x0, y0, x1, y1 = box
+        r = self._range(box)
+
+        # Past a point, visiting every item is cheaper than every cell
+        if (r[2] - r[0] + 1) * (r[3] - r[1] + 1) > len(self.boxes):
+            found = self.boxes.keys()
+
+        else:
+
+            found = set()
+
+            for c in self._cells(r):
+                found.update(self.cells.get(c, ()))
+
+        found = [
+            item for item in found
+            if  self.boxes[item][0] <= x1 and self.boxes[item][2] >= x0
+            and self.boxes[item][1] <= y1 and self.boxes[item][3] >= y0
+        ]
+
+        return sorted(found, key=self.order.__getitem__)
+
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, item):
+        return item in self.boxes